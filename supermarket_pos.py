@@ -1,27 +1,33 @@
 import sys
-from typing import Optional, List
+import argparse
+import contextlib
+import itertools
+import math
+import re
+import http.client
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlencode, urlparse
+from typing import TYPE_CHECKING, Optional, List
 import sqlite3
 from datetime import datetime, date, timedelta
 from PySide6.QtGui import QShortcut, QKeySequence, QColor, QPalette
 from PySide6.QtCore import QTimer
 # --- PATCH START: Sound Feedback + PDF / Printer Receipts Imports ---
 from PySide6.QtMultimedia import QSoundEffect
-from PySide6.QtPrintSupport import QPrinter, QPrintDialog
-from PySide6.QtGui import QTextDocument, QPageSize
+from PySide6.QtPrintSupport import QPrinter, QPrintDialog, QPrinterInfo
+from PySide6.QtGui import QTextDocument, QPageSize, QFontDatabase
 from PySide6.QtCore import QUrl
 from PySide6.QtWidgets import QFileDialog
 from pathlib import Path
 from PySide6.QtWidgets import QLabel, QVBoxLayout
-import pandas as pd
-import numpy as np
-from sklearn.linear_model import LinearRegression
-from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg
-from matplotlib.figure import Figure
 
 # --- PATCH END ---
 
 
-from PySide6.QtCore import Qt, QDate
+from PySide6.QtCore import Qt, QDate, QAbstractTableModel, QModelIndex
+from PySide6.QtCore import QObject, QThread, Signal, Slot, QCoreApplication, QSettings
 from PySide6.QtWidgets import (
     QApplication,
     QMainWindow,
@@ -46,40 +52,141 @@ from PySide6.QtWidgets import (
     QCheckBox,
     QDialog,
     QGridLayout,
+    QTableView,
+    QAbstractItemView,
+    QInputDialog,
 )
 # --- PATCH START: Auto-Restock Imports ---
 from PySide6.QtWidgets import QDialogButtonBox, QSpinBox, QFormLayout, QGridLayout, QDialog
 # --- PATCH END ---
-# --- PATCH START: Visual Stock Dashboard (Matplotlib) ---
-import matplotlib
-matplotlib.use("Agg")  # headless-safe backend
-from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg
-from matplotlib.figure import Figure
-# --- PATCH END ---
-# --- PATCH START: Export, Email, Google Sheets, AI Analytics Imports ---
-import os, ssl, smtplib, json
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
-
-import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
-from sklearn.linear_model import LinearRegression
-import numpy as np
-# --- PATCH END ---
+import os, json
+
+# --- Lazily imported heavy dependencies ---
+# The billing path only needs Qt + sqlite3. pandas, numpy, scikit-learn,
+# matplotlib, gspread/google-auth and the SMTP stack are imported inside the
+# Dashboard, AI Insights, export, email and Google Sheets code paths on first
+# use, which keeps several seconds off a cold till start.
+# `python supermarket_pos.py --bench-startup` measures the difference.
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+def _load_matplotlib():
+    """Import matplotlib's Qt canvas on first chart; returns (FigureCanvasQTAgg, Figure)."""
+    import matplotlib
+    matplotlib.use("Agg")  # headless-safe backend
+    from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg
+    from matplotlib.figure import Figure
+    return FigureCanvasQTAgg, Figure
+
+
+OPTIONAL_HEAVY_MODULES = (
+    "pandas",
+    "numpy",
+    "matplotlib.figure",
+    "matplotlib.backends.backend_qtagg",
+    "gspread",
+    "google.oauth2.service_account",
+    "smtplib",
+)
+
+
+def preload_optional_dependencies() -> None:
+    """Import every lazily-loaded dependency now (benchmarks / background prewarm)."""
+    import importlib
+
+    _load_matplotlib()
+    for name in OPTIONAL_HEAVY_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
 
 
 # --------- Database Layer --------- #
 
+# SQLite connection tuning applied by Database on connect. Any key can be
+# overridden per instance, e.g. Database(path, profile={"synchronous": "FULL"});
+# a value of None leaves SQLite's default in place.
+#  - WAL lets reports/dashboards read while the till is writing an invoice.
+#  - synchronous=NORMAL under WAL only fsyncs at checkpoints, so a commit no longer
+#    costs an fsync; an app crash loses nothing, a power cut may lose the last commits.
+DEFAULT_CONNECTION_PROFILE = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -32000,            # negative = KiB, i.e. ~32 MB page cache
+    "mmap_size": 256 * 1024 * 1024,  # bytes of the DB file memory-mapped for reads
+    "temp_store": "MEMORY",          # sort / GROUP BY temp b-trees in RAM
+    "busy_timeout": 5000,            # ms to wait for another writer before "database is locked"
+}
+
+_PRAGMA_CHOICES = {
+    "journal_mode": {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"},
+    "synchronous": {"OFF", "NORMAL", "FULL", "EXTRA"},
+    "temp_store": {"DEFAULT", "FILE", "MEMORY"},
+}
+
+EXPORT_CHUNK_ROWS = 5000  # rows fetched from SQLite per write by the streaming exports
+
+
 class Database:
     """Simple SQLite wrapper for supermarket POS."""
 
-    def __init__(self, path: str = "supermarket.db") -> None:
-        self.conn = sqlite3.connect(path)
+    def __init__(
+        self,
+        path: str = "supermarket.db",
+        profile: Optional[dict] = None,
+        check_same_thread: bool = True,
+    ) -> None:
+        self.path = path
+        self.profile = {**DEFAULT_CONNECTION_PROFILE, **(profile or {})}
+        busy_timeout = self.profile.get("busy_timeout") or 0
+        self.conn = sqlite3.connect(
+            path, timeout=busy_timeout / 1000.0, check_same_thread=check_same_thread
+        )
         self.conn.row_factory = sqlite3.Row
+        self._apply_connection_profile()
+        # In-memory catalog of active products, keyed by code and id (see get_product_by_code)
+        self._products_by_code: dict = {}
+        self._products_by_id: dict = {}
+        self._product_cache_loaded = False
+        # PRAGMA data_version the cache was loaded at, plus per code/id re-checks since
+        self._product_cache_version: Optional[int] = None
+        self._product_checked: dict = {}
+        # Reorder plan per active product (see get_reorder_plan)
+        self._reorder_plan: dict = {}
+        self._reorder_day: Optional[str] = None
+        self._reorder_stale: set = set()
+        # PRAGMA data_version the whole plan was computed at, plus per-product re-checks since
+        self._reorder_version: Optional[int] = None
+        self._reorder_checked: dict = {}
+        # archive_<year> schemas currently ATTACHed, least recently used first
+        self._attached_archives: List[str] = []
         self.init_schema()
+
+    def open_reader(self) -> "Database":
+        """Open another connection to the same file, usable from a worker thread."""
+        return Database(self.path, self.profile, check_same_thread=False)
+
+    def _apply_connection_profile(self) -> None:
+        """Issue the PRAGMAs from self.profile on the open connection."""
+        cur = self.conn.cursor()
+        for pragma in ("journal_mode", "synchronous", "temp_store"):
+            value = self.profile.get(pragma)
+            if value is None:
+                continue
+            value = str(value).upper()
+            if value not in _PRAGMA_CHOICES[pragma]:
+                raise ValueError(f"Invalid {pragma} in connection profile: {value}")
+            # journal_mode stays "memory" for :memory: databases; that's fine
+            cur.execute(f"PRAGMA {pragma} = {value};")
+        for pragma in ("cache_size", "mmap_size", "busy_timeout"):
+            value = self.profile.get(pragma)
+            if value is None:
+                continue
+            cur.execute(f"PRAGMA {pragma} = {int(value)};")
+
     def seed_initial_data(self) -> None:
         """Optional: populate sample products if DB empty."""
         cur = self.conn.cursor()
@@ -97,7 +204,13 @@ class Database:
                 """,
                 products,
             )
+            cur.execute("SELECT id, stock FROM products;")
+            self._record_movements(
+                cur, "open", {row["id"]: row["stock"] for row in cur.fetchall()},
+                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            )
             self.conn.commit()
+            self.invalidate_product_cache()
             ### >>> PATCH START: Create missing tables ###
             # Ensure all dependent tables exist if running fresh
             cur.execute("""
@@ -174,12 +287,6 @@ class Database:
                 active INTEGER NOT NULL DEFAULT 1
             );
         """)
-
-        # Backward compatibility upgrade
-        cur.execute("PRAGMA table_info(products);")
-        cols = [c[1] for c in cur.fetchall()]
-        if "restock_level" not in cols:
-            cur.execute("ALTER TABLE products ADD COLUMN restock_level REAL NOT NULL DEFAULT 5;")
         self.conn.commit()
         # --- PATCH START: Create missing tables ---
         cur.execute("""
@@ -234,6 +341,351 @@ class Database:
         """)
         self.conn.commit()
         # --- PATCH END ---
+        self._run_migrations()
+        # FTS5 may be missing from very old SQLite builds; searches then fall back to LIKE
+        cur.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'products_fts';")
+        row = cur.fetchone()
+        self.fts_enabled = row is not None
+        # Trigram indexes match substrings anywhere ("asmati", "1004"); word-prefix ones don't
+        self.fts_trigram = row is not None and "trigram" in row["sql"]
+
+    # ----- Schema migrations ----- #
+
+    # (version, description, method). Append new steps at the end; never renumber.
+    SCHEMA_MIGRATIONS = [
+        (1, "products.restock_level column", "_migrate_restock_level"),
+        (2, "indexes for invoice and invoice_items access paths", "_migrate_invoice_indexes"),
+        (3, "FTS5 search index for products and customers", "_migrate_search_index"),
+        (4, "daily sales rollups per day, product and customer", "_migrate_sales_rollups"),
+        (5, "stock movement ledger with daily stock checkpoints", "_migrate_stock_ledger"),
+        (6, "trigram tokenizer for substring search", "_migrate_search_trigram"),
+    ]
+
+    def get_schema_version(self) -> int:
+        cur = self.conn.cursor()
+        cur.execute("SELECT value FROM settings WHERE key = 'schema_version';")
+        row = cur.fetchone()
+        return int(row["value"]) if row else 0
+
+    def _run_migrations(self) -> None:
+        """Bring an existing database up to the latest schema version in place.
+
+        Each step runs in its own transaction together with the version bump,
+        so an interrupted upgrade resumes from the last completed step. The
+        version is re-read under the write lock, so two tills starting together
+        never apply the same step twice.
+        """
+        if self.get_schema_version() >= self.SCHEMA_MIGRATIONS[-1][0]:
+            return
+        for version, _description, method in self.SCHEMA_MIGRATIONS:
+            cur = self.conn.cursor()
+            cur.execute("BEGIN IMMEDIATE;")
+            if self.get_schema_version() >= version:
+                self.conn.rollback()
+                continue
+            try:
+                getattr(self, method)(cur)
+                cur.execute(
+                    "REPLACE INTO settings (key, value) VALUES ('schema_version', ?);",
+                    (str(version),),
+                )
+            except Exception:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+
+    def _migrate_restock_level(self, cur) -> None:
+        # Databases created before per-product restock thresholds
+        cur.execute("PRAGMA table_info(products);")
+        cols = [c[1] for c in cur.fetchall()]
+        if "restock_level" not in cols:
+            cur.execute("ALTER TABLE products ADD COLUMN restock_level REAL NOT NULL DEFAULT 5;")
+
+    def _migrate_invoice_indexes(self, cur) -> None:
+        # Date-range reports and the sales trend (covers SUM(grand_total) by day)
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_invoices_datetime ON invoices (datetime, grand_total);"
+        )
+        # Invoice detail lookups and the invoices -> lines joins
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_invoice_items_invoice "
+            "ON invoice_items (invoice_id, product_id, quantity);"
+        )
+        # Per-product sales history
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_invoice_items_product ON invoice_items (product_id, invoice_id);"
+        )
+
+    # Full-text search tables kept in sync with their base table by triggers.
+    # Stock/price updates don't fire them (AFTER UPDATE OF <indexed columns>).
+    _SEARCH_INDEXES = {
+        "products_fts": ("products", ("code", "name", "category")),
+        "customers_fts": ("customers", ("name", "phone", "email")),
+    }
+
+    def _migrate_search_index(self, cur) -> None:
+        try:
+            cur.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp._fts5_probe USING fts5(x);")
+            cur.execute("DROP TABLE temp._fts5_probe;")
+        except sqlite3.OperationalError:
+            return  # no FTS5 in this SQLite build
+        self._create_search_indexes(cur, "tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'")
+
+    def _migrate_search_trigram(self, cur) -> None:
+        # Cashiers type fragments of codes and names; the trigram tokenizer
+        # (SQLite 3.34+) indexes those, word-prefix matching does not.
+        try:
+            cur.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x, tokenize='trigram');")
+            cur.execute("DROP TABLE temp._fts5_probe;")
+        except sqlite3.OperationalError:
+            return  # keep the word-prefix index (or LIKE) on older builds
+        for fts in self._SEARCH_INDEXES:
+            for suffix in ("ai", "ad", "au"):
+                cur.execute(f"DROP TRIGGER IF EXISTS {fts}_{suffix};")
+            cur.execute(f"DROP TABLE IF EXISTS {fts};")
+        self._create_search_indexes(cur, "tokenize='trigram case_sensitive 0'")
+
+    def _create_search_indexes(self, cur, options: str) -> None:
+        for fts, (table, cols) in self._SEARCH_INDEXES.items():
+            col_list = ", ".join(cols)
+            new_vals = ", ".join(f"new.{c}" for c in cols)
+            old_vals = ", ".join(f"old.{c}" for c in cols)
+            cur.execute(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                    {col_list},
+                    content='{table}', content_rowid='id',
+                    {options}
+                );
+            """)
+            cur.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+                    INSERT INTO {fts} (rowid, {col_list}) VALUES (new.id, {new_vals});
+                END;
+            """)
+            cur.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+                    INSERT INTO {fts} ({fts}, rowid, {col_list}) VALUES ('delete', old.id, {old_vals});
+                END;
+            """)
+            cur.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {col_list} ON {table} BEGIN
+                    INSERT INTO {fts} ({fts}, rowid, {col_list}) VALUES ('delete', old.id, {old_vals});
+                    INSERT INTO {fts} (rowid, {col_list}) VALUES (new.id, {new_vals});
+                END;
+            """)
+            # Index rows that existed before the upgrade
+            cur.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild');")
+
+    def _migrate_sales_rollups(self, cur) -> None:
+        # One row per day (and per product / customer per day), kept current by
+        # create_invoice so dashboards read O(days) rows instead of every line.
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS sales_daily (
+                day TEXT PRIMARY KEY,
+                invoice_count INTEGER NOT NULL DEFAULT 0,
+                subtotal REAL NOT NULL DEFAULT 0,
+                discount REAL NOT NULL DEFAULT 0,
+                tax_total REAL NOT NULL DEFAULT 0,
+                grand_total REAL NOT NULL DEFAULT 0
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS sales_daily_product (
+                day TEXT NOT NULL,
+                product_id INTEGER NOT NULL,
+                quantity REAL NOT NULL DEFAULT 0,
+                revenue REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, product_id)
+            ) WITHOUT ROWID;
+        """)
+        # customer_id 0 stands for walk-in sales (invoices without a customer)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS sales_daily_customer (
+                day TEXT NOT NULL,
+                customer_id INTEGER NOT NULL,
+                invoice_count INTEGER NOT NULL DEFAULT 0,
+                grand_total REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, customer_id)
+            ) WITHOUT ROWID;
+        """)
+        self._rebuild_rollups(cur)
+
+    def _rebuild_rollups(self, cur, since_day: str = "") -> None:
+        # Days before since_day are left alone (their invoices may be archived)
+        for table in ("sales_daily", "sales_daily_product", "sales_daily_customer"):
+            cur.execute(f"DELETE FROM {table} WHERE day >= ?;", (since_day,))
+        cur.execute("""
+            INSERT INTO sales_daily (day, invoice_count, subtotal, discount, tax_total, grand_total)
+            SELECT DATE(datetime), COUNT(*), TOTAL(subtotal), TOTAL(discount),
+                   TOTAL(tax_total), TOTAL(grand_total)
+              FROM invoices
+             WHERE datetime >= ?
+             GROUP BY DATE(datetime);
+        """, (since_day,))
+        cur.execute("""
+            INSERT INTO sales_daily_product (day, product_id, quantity, revenue)
+            SELECT DATE(invoices.datetime), invoice_items.product_id,
+                   TOTAL(invoice_items.quantity), TOTAL(invoice_items.line_total)
+              FROM invoice_items
+              JOIN invoices ON invoice_items.invoice_id = invoices.id
+             WHERE invoice_items.product_id IS NOT NULL AND invoices.datetime >= ?
+             GROUP BY DATE(invoices.datetime), invoice_items.product_id;
+        """, (since_day,))
+        cur.execute("""
+            INSERT INTO sales_daily_customer (day, customer_id, invoice_count, grand_total)
+            SELECT DATE(datetime), IFNULL(customer_id, 0), COUNT(*), TOTAL(grand_total)
+              FROM invoices
+             WHERE datetime >= ?
+             GROUP BY DATE(datetime), IFNULL(customer_id, 0);
+        """, (since_day,))
+
+    def rebuild_rollups(self) -> None:
+        """Recompute the daily sales rollups from the invoices in the live database,
+        and the daily stock checkpoints from the stock ledger.
+
+        Days already moved out by archive_invoices keep their rollup rows.
+        """
+        cur = self.conn.cursor()
+        with self.conn:
+            cur.execute("BEGIN IMMEDIATE;")
+            self._rebuild_rollups(cur, self.get_setting("archived_before") or "")
+            self._rebuild_stock_daily(cur)
+
+    def _update_rollups(self, cur, day: str, customer_id: Optional[int], lines: list, totals: tuple) -> None:
+        """Fold one new invoice into the daily rollups (inside its transaction)."""
+        subtotal, discount, tax_total, grand_total = totals
+        cur.execute(
+            """
+            INSERT INTO sales_daily (day, invoice_count, subtotal, discount, tax_total, grand_total)
+            VALUES (?, 1, ?, ?, ?, ?)
+            ON CONFLICT (day) DO UPDATE SET
+                invoice_count = invoice_count + 1,
+                subtotal = subtotal + excluded.subtotal,
+                discount = discount + excluded.discount,
+                tax_total = tax_total + excluded.tax_total,
+                grand_total = grand_total + excluded.grand_total;
+            """,
+            (day, subtotal, discount, tax_total, grand_total),
+        )
+        cur.executemany(
+            """
+            INSERT INTO sales_daily_product (day, product_id, quantity, revenue)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (day, product_id) DO UPDATE SET
+                quantity = quantity + excluded.quantity,
+                revenue = revenue + excluded.revenue;
+            """,
+            [(day, pid, qty, line_total) for pid, _code, _name, qty, _price, _tax, line_total in lines],
+        )
+        cur.execute(
+            """
+            INSERT INTO sales_daily_customer (day, customer_id, invoice_count, grand_total)
+            VALUES (?, ?, 1, ?)
+            ON CONFLICT (day, customer_id) DO UPDATE SET
+                invoice_count = invoice_count + 1,
+                grand_total = grand_total + excluded.grand_total;
+            """,
+            (day, customer_id or 0, grand_total),
+        )
+
+    def _migrate_stock_ledger(self, cur) -> None:
+        # Append-only: every stock change is one row carrying the product's
+        # balance afterwards, so "stock of X at time T" is a single index seek.
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS stock_movements (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts TEXT NOT NULL,
+                product_id INTEGER NOT NULL,
+                delta REAL NOT NULL,
+                balance_after REAL NOT NULL,
+                reason TEXT NOT NULL,
+                ref_id INTEGER,
+                FOREIGN KEY (product_id) REFERENCES products(id)
+            );
+        """)
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_stock_movements_product ON stock_movements (product_id, ts);"
+        )
+        # Closing total stock per day with movements, so store-wide stock at
+        # any date is one seek too instead of replaying the ledger.
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS stock_daily (
+                day TEXT PRIMARY KEY,
+                total_stock REAL NOT NULL DEFAULT 0,
+                movements INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID;
+        """)
+        # History before the upgrade is unknown: open the ledger at today's stock
+        cur.execute(
+            """
+            INSERT INTO stock_movements (ts, product_id, delta, balance_after, reason)
+            SELECT ?, id, stock, stock, 'open' FROM products WHERE stock != 0;
+            """,
+            (datetime.now().strftime("%Y-%m-%d %H:%M:%S"),),
+        )
+        self._rebuild_stock_daily(cur)
+
+    @staticmethod
+    def _rebuild_stock_daily(cur) -> None:
+        # Opening rows carry the full balance as their delta, so a running
+        # sum of deltas over days is the closing stock of each day.
+        cur.execute("DELETE FROM stock_daily;")
+        cur.execute("""
+            INSERT INTO stock_daily (day, total_stock, movements)
+            SELECT DATE(ts), SUM(TOTAL(delta)) OVER (ORDER BY DATE(ts)), COUNT(*)
+              FROM stock_movements
+             GROUP BY DATE(ts);
+        """)
+
+    @staticmethod
+    def _record_movements(cur, reason: str, deltas: dict, ts: str, ref_id: Optional[int] = None) -> None:
+        """Append {product_id: delta} to the stock ledger (inside the write's transaction).
+
+        Call after products.stock has been changed: balance_after is read back from it.
+        """
+        rows = [(ts, delta, reason, ref_id, pid) for pid, delta in deltas.items() if delta]
+        if not rows:
+            return
+        cur.executemany(
+            """
+            INSERT INTO stock_movements (ts, product_id, delta, balance_after, reason, ref_id)
+            SELECT ?, id, ?, stock, ?, ? FROM products WHERE id = ?;
+            """,
+            rows,
+        )
+        # A new day opens from the latest earlier checkpoint
+        day, net = ts[:10], sum(row[1] for row in rows)
+        cur.execute(
+            """
+            INSERT INTO stock_daily (day, total_stock, movements)
+            SELECT ?, IFNULL((SELECT total_stock FROM stock_daily WHERE day < ?
+                               ORDER BY day DESC LIMIT 1), 0) + ?, ?
+             WHERE 1
+            ON CONFLICT (day) DO UPDATE SET
+                total_stock = total_stock + ?,
+                movements = movements + excluded.movements;
+            """,
+            (day, day, net, len(rows), net),
+        )
+
+    def _fts_match_expression(self, search_text: str) -> Optional[str]:
+        """Turn free text into an FTS5 query, or None to search with LIKE instead.
+
+        With the trigram index every word must occur somewhere as a substring
+        (words under 3 characters can't be looked up, so those go to LIKE);
+        with the older word index every word must match as a prefix.
+        """
+        if not self.fts_enabled:
+            return None
+        if self.fts_trigram:
+            words = search_text.split()
+            if not words or any(len(w) < 3 for w in words):
+                return None
+            return " ".join('"' + w.replace('"', '""') + '"' for w in words)
+        words = re.findall(r"\w+", search_text)
+        if not words:
+            return None
+        return " ".join('"' + w.replace('"', '""') + '"*' for w in words)
 
     def add_product(self, code, name, category, price, tax_rate, stock, active, restock_level=5.0) -> None:
         cur = self.conn.cursor()
@@ -244,28 +696,89 @@ class Database:
             """,
             (code, name, category, price, tax_rate, stock, restock_level, 1 if active else 0),
         )
+        product_id = cur.lastrowid
+        self._record_movements(
+            cur, "new", {product_id: float(stock)}, datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        )
         self.conn.commit()
+        self.invalidate_product_cache([product_id])
 
     def update_product(
         self, product_id, code, name, category, price, tax_rate, stock, active, restock_level
     ) -> None:
         cur = self.conn.cursor()
-        cur.execute(
-            """
-            UPDATE products
-               SET code=?, name=?, category=?, price=?, tax_rate=?, stock=?, restock_level=?, active=?
-             WHERE id=?;
-            """,
-            (code, name, category, price, tax_rate, stock, restock_level, 1 if active else 0, product_id),
-        )
-        self.conn.commit()
+        with self.conn:
+            # Lock first so the ledger delta is taken against the stock we overwrite
+            cur.execute("BEGIN IMMEDIATE;")
+            cur.execute("SELECT stock FROM products WHERE id = ?;", (product_id,))
+            row = cur.fetchone()
+            cur.execute(
+                """
+                UPDATE products
+                   SET code=?, name=?, category=?, price=?, tax_rate=?, stock=?, restock_level=?, active=?
+                 WHERE id=?;
+                """,
+                (code, name, category, price, tax_rate, stock, restock_level, 1 if active else 0, product_id),
+            )
+            if row is not None:
+                self._record_movements(
+                    cur, "edit", {product_id: float(stock) - row["stock"]},
+                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                )
+        self.invalidate_product_cache([product_id])
 
         # --- PATCH END ---
         # ----- Product operations ----- #
 
     def get_products(self, active_only: bool = True, search_text: Optional[str] = None):
+        return self.iter_products(active_only, search_text).fetchall()
+
+    def iter_products(self, active_only: bool = True, search_text: Optional[str] = None) -> sqlite3.Cursor:
+        """Same query as get_products, but returns the open cursor.
+
+        Read it to the end promptly: under WAL an unfinished cursor pins its
+        connection to an old snapshot (and blocks that connection's writes).
+        Grids page with search_product_ids / get_products_by_ids instead.
+        """
+        query, params = self._product_search_query("products.*", active_only, search_text)
+        cur = self.conn.cursor()
+        cur.execute(query, params)
+        return cur
+
+    def search_product_ids(self, active_only: bool = True, search_text: Optional[str] = None) -> list:
+        """Ids of the products get_products would return, in the same order."""
+        query, params = self._product_search_query("products.id", active_only, search_text)
+        cur = self.conn.cursor()
+        cur.row_factory = None
+        cur.execute(query, params)
+        return [row[0] for row in cur.fetchall()]
+
+    def get_products_by_ids(self, ids) -> list:
+        """Current rows for ``ids``, in that order (ids no longer in the table are skipped)."""
+        ids = list(ids)
+        if not ids:
+            return []
         cur = self.conn.cursor()
-        query = "SELECT * FROM products WHERE 1=1"
+        cur.execute(f"SELECT * FROM products WHERE id IN ({','.join('?' * len(ids))});", ids)
+        by_id = {row["id"]: row for row in cur.fetchall()}
+        return [by_id[pid] for pid in ids if pid in by_id]
+
+    def _product_search_query(self, columns: str, active_only: bool, search_text: Optional[str]):
+        match = self._fts_match_expression(search_text) if search_text else None
+        if match:
+            # Indexed search; best matches first (a hit on code outranks name, then category)
+            query = f"""
+                SELECT {columns} FROM products_fts
+                  JOIN products ON products.id = products_fts.rowid
+                 WHERE products_fts MATCH ?
+            """
+            params = [match]
+            if active_only:
+                query += " AND products.active = 1"
+            query += " ORDER BY bm25(products_fts, 10.0, 5.0, 1.0), products.name ASC;"
+            return query, params
+
+        query = f"SELECT {columns} FROM products WHERE 1=1"
         params = []
         if active_only:
             query += " AND active = 1"
@@ -274,26 +787,259 @@ class Database:
             like = f"%{search_text}%"
             params.extend([like, like, like])
         query += " ORDER BY name ASC;"
-        cur.execute(query, params)
-        return cur.fetchall()
+        return query, params
 
     def get_product_by_code(self, code: str):
-        """Fetch a single product by its unique code."""
-        cur = self.conn.cursor()
-        cur.execute("SELECT * FROM products WHERE code = ? AND active = 1;", (code,))
-        return cur.fetchone()
+        """Fetch a single active product by its unique code (served from the catalog cache)."""
+        self._check_cached_product("code", code)
+        return self._products_by_code.get(code)
+
+    def get_product_by_id(self, product_id: int):
+        """Fetch a single active product by id (served from the catalog cache)."""
+        self._check_cached_product("id", product_id)
+        return self._products_by_id.get(product_id)
 
 
     def deactivate_product(self, product_id: int) -> None:
         cur = self.conn.cursor()
         cur.execute("UPDATE products SET active = 0 WHERE id = ?;", (product_id,))
         self.conn.commit()
+        self.invalidate_product_cache([product_id])
+
+    def restock_products(self, restock_data: dict[int, float]) -> None:
+        """Add quantities to stock, {product_id: quantity_to_add}."""
+        cur = self.conn.cursor()
+        for pid, qty in restock_data.items():
+            cur.execute("UPDATE products SET stock = stock + ? WHERE id = ?;", (qty, pid))
+        self._record_movements(
+            cur, "restock", {pid: float(qty) for pid, qty in restock_data.items()},
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        )
+        self.conn.commit()
+        self.invalidate_product_cache(restock_data.keys())
+
+    # ----- Product catalog cache ----- #
+
+    def _load_product_cache(self) -> None:
+        """Load every active product into the code/id lookup maps in one query."""
+        cur = self.conn.cursor()
+        cur.execute("PRAGMA data_version;")
+        self._product_cache_version = cur.fetchone()[0]
+        self._product_checked = {}
+        cur.execute("SELECT * FROM products WHERE active = 1;")
+        self._products_by_code = {}
+        self._products_by_id = {}
+        for row in cur.fetchall():
+            self._products_by_code[row["code"]] = row
+            self._products_by_id[row["id"]] = row
+        self._product_cache_loaded = True
+
+    def _check_cached_product(self, column: str, value) -> None:
+        """Re-read one cached product if another connection has committed since it was read.
+
+        Other tills write to the same file without going through this object, so
+        PRAGMA data_version (which only moves on *other* connections' commits) is
+        compared on every lookup; each product is re-read at most once per change.
+        """
+        if not self._product_cache_loaded:
+            self._load_product_cache()
+            return
+        cur = self.conn.cursor()
+        cur.execute("PRAGMA data_version;")
+        version = cur.fetchone()[0]
+        if self._product_checked.get(value, self._product_cache_version) == version:
+            return
+        by_column = self._products_by_code if column == "code" else self._products_by_id
+        old = by_column.pop(value, None)
+        if old is not None:
+            self._products_by_code.pop(old["code"], None)
+            self._products_by_id.pop(old["id"], None)
+        cur.execute(f"SELECT * FROM products WHERE active = 1 AND {column} = ?;", (value,))
+        row = cur.fetchone()
+        self._product_checked[value] = version
+        if row is not None:
+            stale = self._products_by_id.pop(row["id"], None)
+            if stale is not None:
+                self._products_by_code.pop(stale["code"], None)
+            self._products_by_code[row["code"]] = row
+            self._products_by_id[row["id"]] = row
+            self._product_checked[row["code"]] = self._product_checked[row["id"]] = version
+
+    def invalidate_product_cache(self, product_ids=None) -> None:
+        """Re-read the given products into the cache, or drop the whole cache if None.
+
+        Must be called after every committed write to ``products``. Also marks
+        the same products for a reorder plan refresh.
+        """
+        if product_ids is None:
+            self._reorder_day = None
+        else:
+            self._reorder_stale.update(int(pid) for pid in product_ids)
+
+        if product_ids is None or not self._product_cache_loaded:
+            self._products_by_code = {}
+            self._products_by_id = {}
+            self._product_cache_loaded = False
+            return
+
+        ids = list({int(pid) for pid in product_ids})
+        if not ids:
+            return
+        for pid in ids:
+            old = self._products_by_id.pop(pid, None)
+            if old is not None:
+                self._products_by_code.pop(old["code"], None)
+
+        cur = self.conn.cursor()
+        placeholders = ",".join("?" * len(ids))
+        cur.execute(
+            f"SELECT * FROM products WHERE active = 1 AND id IN ({placeholders});",
+            ids,
+        )
+        for row in cur.fetchall():
+            self._products_by_code[row["code"]] = row
+            self._products_by_id[row["id"]] = row
+
+    # ----- Reorder plan ----- #
+
+    REORDER_VELOCITY_DAYS = 28  # sales history behind the daily velocity
+    REORDER_LEAD_DAYS = 3       # supplier lead time the stock must cover
+    REORDER_COVER_DAYS = 14     # days of demand an order should add on top
+
+    def _query_reorder_plan(self, product_ids=None) -> list:
+        """One set-based pass: velocity, days of cover and order quantity per product.
+
+        restock_level acts as safety stock on top of the lead-time demand.
+        """
+        id_filter, params = "", {
+            "window": float(self.REORDER_VELOCITY_DAYS),
+            "since": (date.today() - timedelta(days=self.REORDER_VELOCITY_DAYS - 1)).isoformat(),
+            "lead": float(self.REORDER_LEAD_DAYS),
+            "cover": float(self.REORDER_COVER_DAYS),
+        }
+        if product_ids is not None:
+            ids = [int(pid) for pid in product_ids]
+            params.update({f"p{n}": pid for n, pid in enumerate(ids)})
+            id_filter = "AND {col} IN (" + ",".join(f":p{n}" for n in range(len(ids))) + ")"
+        cur = self.conn.cursor()
+        cur.execute(
+            f"""
+            WITH velocity AS (
+                SELECT product_id, SUM(quantity) / :window AS per_day
+                  FROM sales_daily_product
+                 WHERE day >= :since {id_filter.format(col="product_id")}
+              GROUP BY product_id
+            ),
+            plan AS (
+                SELECT p.id, p.code, p.name, p.category, p.stock, p.restock_level,
+                       IFNULL(v.per_day, 0.0) AS velocity,
+                       IFNULL(v.per_day, 0.0) * (:lead + :cover) + p.restock_level - p.stock AS shortfall
+                  FROM products AS p
+             LEFT JOIN velocity AS v ON v.product_id = p.id
+                 WHERE p.active = 1 {id_filter.format(col="p.id")}
+            )
+            SELECT id, code, name, category, stock, restock_level, velocity,
+                   CASE WHEN velocity > 0 THEN stock / velocity END AS days_of_cover,
+                   stock <= velocity * :lead + restock_level AS needs_reorder,
+                   CASE WHEN shortfall > 0
+                        THEN CAST(shortfall AS INTEGER) + (shortfall > CAST(shortfall AS INTEGER))
+                        ELSE 0 END AS suggested_qty
+              FROM plan;
+            """,
+            params,
+        )
+        return cur.fetchall()
+
+    def get_reorder_plan(self, product_ids=None) -> list:
+        """Reorder plan rows for the given products (default: all active products).
+
+        Computed for the whole catalog once per day (the velocity window moves)
+        and refreshed only for products whose stock changed since, so calling
+        this after every invoice stays cheap. Commits from other connections
+        (other tills) move PRAGMA data_version: the requested products are then
+        re-read, or the whole plan when all of it is asked for.
+        """
+        if product_ids is not None:
+            product_ids = [int(pid) for pid in product_ids]
+        today = date.today().isoformat()
+        cur = self.conn.cursor()
+        cur.execute("PRAGMA data_version;")
+        version = cur.fetchone()[0]
+        if self._reorder_day != today or (product_ids is None and version != self._reorder_version):
+            self._reorder_plan = {row["id"]: row for row in self._query_reorder_plan()}
+            self._reorder_day = today
+            self._reorder_version = version
+            self._reorder_checked = {}
+            self._reorder_stale.clear()
+            ids = []
+        else:
+            ids = set(self._reorder_stale)
+            if product_ids is not None and version != self._reorder_version:
+                ids.update(
+                    pid for pid in product_ids
+                    if self._reorder_checked.get(pid, self._reorder_version) != version
+                )
+                self._reorder_checked.update(dict.fromkeys(ids, version))
+            ids = list(ids)
+        if ids:
+            self._reorder_stale.clear()
+            for pid in ids:
+                self._reorder_plan.pop(pid, None)
+            for row in self._query_reorder_plan(ids):
+                self._reorder_plan[row["id"]] = row
+        if product_ids is None:
+            return list(self._reorder_plan.values())
+        return [self._reorder_plan[pid] for pid in dict.fromkeys(product_ids) if pid in self._reorder_plan]
+
+    def get_reorder_suggestions(self, product_ids=None, pending: Optional[dict] = None) -> list:
+        """Plan rows that need ordering now, least days of cover first.
+
+        ``pending`` is {product_id: quantity} sold but not yet written (see
+        InvoiceWriteQueue); it comes off stock before the plan is re-derived.
+        """
+        rows = self.get_reorder_plan(product_ids)
+        if pending:
+            rows = [self._plan_less_pending(row, pending.get(row["id"], 0.0)) for row in rows]
+        rows = [row for row in rows if row["needs_reorder"]]
+        rows.sort(key=lambda r: float("inf") if r["days_of_cover"] is None else r["days_of_cover"])
+        return rows
+
+    def _plan_less_pending(self, row, sold: float):
+        """A reorder plan row as a dict, recomputed as if ``sold`` more units were gone."""
+        if not sold:
+            return row
+        plan = dict(row)
+        # Once written, the sale also lands in today's rollup behind the velocity
+        stock = plan["stock"] - sold
+        velocity = plan["velocity"] + sold / self.REORDER_VELOCITY_DAYS
+        shortfall = velocity * (self.REORDER_LEAD_DAYS + self.REORDER_COVER_DAYS) + plan["restock_level"] - stock
+        plan.update(
+            stock=stock,
+            velocity=velocity,
+            days_of_cover=stock / velocity if velocity > 0 else None,
+            needs_reorder=int(stock <= velocity * self.REORDER_LEAD_DAYS + plan["restock_level"]),
+            suggested_qty=max(0, math.ceil(shortfall)),
+        )
+        return plan
 
     # ----- Customer operations ----- #
 
     def get_customers(self, active_only: bool = True, search_text: Optional[str] = None):
 
         cur = self.conn.cursor()
+        match = self._fts_match_expression(search_text) if search_text else None
+        if match:
+            query = """
+                SELECT customers.* FROM customers_fts
+                  JOIN customers ON customers.id = customers_fts.rowid
+                 WHERE customers_fts MATCH ?
+            """
+            if active_only:
+                query += " AND customers.active = 1"
+            query += " ORDER BY bm25(customers_fts, 5.0, 3.0, 1.0), customers.name ASC;"
+            cur.execute(query, [match])
+            return cur.fetchall()
+
         query = "SELECT * FROM customers WHERE 1=1"
         params: list = []
         if active_only:
@@ -378,192 +1124,580 @@ class Database:
         notes: str,
     ):
         """Create invoice, adjust stock, return (invoice_id, totals_dict)."""
-        if not cart_items:
-            raise ValueError("Cart is empty")
-
+        invoice = self.prepare_invoice(
+            customer_id, cart_items, global_discount_percent, payment_method, paid_amount, notes
+        )
         cur = self.conn.cursor()
-
         with self.conn:
-            cur = self.conn.cursor()
+            # Take the write lock now: the transaction is short, and other
+            # tills wait on busy_timeout instead of failing mid-transaction.
+            cur.execute("BEGIN IMMEDIATE;")
+            invoice_id = self._write_invoice(cur, invoice)
+            if invoice_id is None:
+                # Another till sold the units since prepare_invoice checked
+                self.conn.rollback()
+                self._check_stock(cur, cart_items, self._invoice_quantities(invoice))
+                raise ValueError("Stock changed during checkout, please try again.")
 
-            # Check stock
-            for item in cart_items:
-                pid = item["product_id"]
-                qty = float(item["quantity"])
-                cur.execute("SELECT stock FROM products WHERE id = ?;", (pid,))
-                row = cur.fetchone()
-                if row is None:
-                    raise ValueError(f"Product not found (id={pid})")
-                if row["stock"] < qty:
-                    raise ValueError(
-                        f"Insufficient stock for {item['name']} "
-                        f"(available {row['stock']}, requested {qty})"
-                    )
+        # no explicit commit needed – handled by context manager
+        self.invalidate_product_cache(self._invoice_quantities(invoice))
+        return invoice_id, self.invoice_totals(invoice)
 
-            discount_factor = 1.0 - (global_discount_percent / 100.0)
-            subtotal = discount_total = tax_total = grand_total = 0.0
+    def prepare_invoice(
+        self,
+        customer_id: Optional[int],
+        cart_items: List[dict],
+        global_discount_percent: float,
+        payment_method: str,
+        paid_amount: float,
+        notes: str,
+        pending: Optional[dict] = None,
+    ) -> dict:
+        """Validate a checkout and compute its lines and totals, without writing.
 
-            for item in cart_items:
-                price = float(item["price"])
-                qty = float(item["quantity"])
-                tax_rate = float(item["tax_rate"])
-                base = price * qty
-                discounted_base = base * discount_factor
-                line_discount = base - discounted_base
-                tax = discounted_base * (tax_rate / 100.0)
-                line_total = discounted_base + tax
-
-                subtotal += base
-                discount_total += line_discount
-                tax_total += tax
-                grand_total += line_total
-
-            if paid_amount < grand_total:
-                raise ValueError(
-                    f"Paid amount ({paid_amount:.2f}) is less than total ({grand_total:.2f})"
-                )
+        Returns a JSON-serializable invoice for _write_invoice (or a journal).
+        ``pending`` is {product_id: quantity} sold but not yet written, which
+        the stock check treats as already gone.
+        """
+        if not cart_items:
+            raise ValueError("Cart is empty")
 
-            change_due = paid_amount - grand_total
-            now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            customer_id_db = customer_id if customer_id is not None else None
+        # Line math once, up front, so the write transaction only does I/O
+        discount_factor = 1.0 - (global_discount_percent / 100.0)
+        subtotal = discount_total = tax_total = grand_total = 0.0
+        lines = []
+        qty_by_product: dict[int, float] = {}
 
-            cur.execute(
-                """
-                INSERT INTO invoices (
-                    datetime, customer_id, subtotal, discount, tax_total,
-                    grand_total, payment_method, paid_amount, change_due, notes
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
-                """,
-                (
-                    now_str,
-                    customer_id_db,
-                    subtotal,
-                    discount_total,
-                    tax_total,
-                    grand_total,
-                    payment_method,
-                    paid_amount,
-                    change_due,
-                    notes,
-                ),
-            )
+        for item in cart_items:
+            pid = item["product_id"]
+            price = float(item["price"])
+            qty = float(item["quantity"])
+            tax_rate = float(item["tax_rate"])
+            base = price * qty
+            discounted_base = base * discount_factor
+            line_discount = base - discounted_base
+            tax = discounted_base * (tax_rate / 100.0)
+            line_total = discounted_base + tax
 
-            invoice_id = cur.lastrowid
+            subtotal += base
+            discount_total += line_discount
+            tax_total += tax
+            grand_total += line_total
 
-            for item in cart_items:
-                pid = item["product_id"]
-                qty = float(item["quantity"])
-                price = float(item["price"])
-                tax_rate = float(item["tax_rate"])
-                name = item["name"]
-                code = item["code"]
-
-                base = price * qty
-                discounted_base = base * discount_factor
-                tax = discounted_base * (tax_rate / 100.0)
-                line_total = discounted_base + tax
+            lines.append((pid, item["code"], item["name"], qty, price, tax_rate, line_total))
+            qty_by_product[pid] = qty_by_product.get(pid, 0.0) + qty
 
-                cur.execute(
-                    """
-                    INSERT INTO invoice_items (
-                        invoice_id, product_id, product_code, product_name,
-                        quantity, unit_price, tax_rate, line_total
-                    )
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?);
-                    """,
-                    (invoice_id, pid, code, name, qty, price, tax_rate, line_total),
-                )
+        # Friendly up-front stock check with a single query. Another till may
+        # still sell the same units before we write; the guarded decrement
+        # in _write_invoice is what actually prevents overselling.
+        cur = self.conn.cursor()
+        self._check_stock(cur, cart_items, qty_by_product, pending)
 
-                # stock update
-                cur.execute(
-                    "UPDATE products SET stock = stock - ? WHERE id = ?;",
-                    (qty, pid),
-                )
+        if paid_amount < grand_total:
+            raise ValueError(
+                f"Paid amount ({paid_amount:.2f}) is less than total ({grand_total:.2f})"
+            )
 
-        # no explicit commit needed – handled by context manager
-        totals = {
+        return {
+            "invoice_id": None,
+            "datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "customer_id": customer_id if customer_id is not None else None,
             "subtotal": subtotal,
             "discount_total": discount_total,
             "tax_total": tax_total,
             "grand_total": grand_total,
+            "payment_method": payment_method,
             "paid_amount": paid_amount,
-            "change_due": change_due,
-            "datetime": now_str,
+            "change_due": paid_amount - grand_total,
+            "notes": notes,
+            "lines": lines,
         }
-        return invoice_id, totals
-
 
-    def get_invoices_between_dates(self, start: date, end: date):
-        cur = self.conn.cursor()
-        start_str = f"{start.isoformat()} 00:00:00"
-        end_str = f"{end.isoformat()} 23:59:59"
-        cur.execute(
-            """
-            SELECT invoices.*, customers.name AS customer_name
-              FROM invoices
-         LEFT JOIN customers ON invoices.customer_id = customers.id
-             WHERE datetime BETWEEN ? AND ?
-          ORDER BY datetime ASC;
+    @staticmethod
+    def invoice_totals(invoice: dict) -> dict:
+        """The totals dict create_invoice returns, for a prepared invoice."""
+        keys = ("subtotal", "discount_total", "tax_total", "grand_total", "paid_amount", "change_due", "datetime")
+        return {key: invoice[key] for key in keys}
+
+    @staticmethod
+    def _invoice_quantities(invoice: dict) -> dict:
+        qty_by_product: dict[int, float] = {}
+        for pid, _code, _name, qty, *_rest in invoice["lines"]:
+            qty_by_product[pid] = qty_by_product.get(pid, 0.0) + qty
+        return qty_by_product
+
+    def _write_invoice(self, cur, invoice: dict, guarded: bool = True) -> Optional[int]:
+        """Write a prepared invoice inside the caller's transaction; return its id.
+
+        Guarded: a product only changes if it still has the stock, so
+        concurrent tills sharing one DB can never oversell; returns None
+        when that fails, and the caller must roll back. Unguarded writes are for
+        sales that already happened, replayed from the invoice journal.
+        An ``invoice_id`` in the invoice is used as the row id.
+        """
+        qty_by_product = self._invoice_quantities(invoice)
+        if guarded:
+            cur.executemany(
+                "UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ?;",
+                [(qty, pid, qty) for pid, qty in qty_by_product.items()],
+            )
+            if cur.rowcount != len(qty_by_product):
+                return None
+        else:
+            cur.executemany(
+                "UPDATE products SET stock = stock - ? WHERE id = ?;",
+                [(qty, pid) for pid, qty in qty_by_product.items()],
+            )
+
+        now_str = invoice["datetime"]
+        cur.execute(
+            """
+            INSERT INTO invoices (
+                id, datetime, customer_id, subtotal, discount, tax_total,
+                grand_total, payment_method, paid_amount, change_due, notes
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
             """,
-            (start_str, end_str),
+            (
+                invoice["invoice_id"],
+                now_str,
+                invoice["customer_id"],
+                invoice["subtotal"],
+                invoice["discount_total"],
+                invoice["tax_total"],
+                invoice["grand_total"],
+                invoice["payment_method"],
+                invoice["paid_amount"],
+                invoice["change_due"],
+                invoice["notes"],
+            ),
         )
-        return cur.fetchall()
+
+        invoice_id = cur.lastrowid
+
+        cur.executemany(
+            """
+            INSERT INTO invoice_items (
+                invoice_id, product_id, product_code, product_name,
+                quantity, unit_price, tax_rate, line_total
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+            """,
+            [(invoice_id, *line) for line in invoice["lines"]],
+        )
+
+        self._update_rollups(
+            cur, now_str[:10], invoice["customer_id"], invoice["lines"],
+            (invoice["subtotal"], invoice["discount_total"], invoice["tax_total"], invoice["grand_total"]),
+        )
+        self._record_movements(
+            cur, "sale", {pid: -qty for pid, qty in qty_by_product.items()}, now_str, invoice_id
+        )
+        return invoice_id
+
+    def reserve_invoice_ids(self, count: int) -> range:
+        """Claim the next ``count`` invoice ids for invoices written later.
+
+        Bumps the AUTOINCREMENT counter, so other connections' invoices are
+        numbered after the block. release_invoice_ids hands back the unused
+        tail if nobody has taken ids since.
+        """
+        cur = self.conn.cursor()
+        with self.conn:
+            cur.execute("BEGIN IMMEDIATE;")
+            cur.execute("SELECT IFNULL(MAX(id), 0) FROM invoices;")
+            last = cur.fetchone()[0]
+            cur.execute("SELECT seq FROM sqlite_sequence WHERE name = 'invoices';")
+            row = cur.fetchone()
+            if row is None:
+                cur.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('invoices', 0);")
+            else:
+                last = max(last, row[0])
+            cur.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'invoices';", (last + count,))
+        return range(last + 1, last + count + 1)
+
+    def release_invoice_ids(self, unused: range) -> None:
+        if not unused:
+            return
+        cur = self.conn.cursor()
+        with self.conn:
+            cur.execute("BEGIN IMMEDIATE;")
+            cur.execute(
+                "UPDATE sqlite_sequence SET seq = ? WHERE name = 'invoices' AND seq = ?;",
+                (unused.start - 1, unused.stop - 1),
+            )
+
+    @staticmethod
+    def _check_stock(cur, cart_items: List[dict], qty_by_product: dict, pending: Optional[dict] = None) -> None:
+        """Raise ValueError if the cart asks for more of a product than is in stock (less ``pending``).
+
+        Compares the cart's total per product, as the guarded decrement does,
+        so the same product on several lines can't pass here and fail there.
+        """
+        pids = list(qty_by_product)
+        placeholders = ",".join("?" * len(pids))
+        cur.execute(f"SELECT id, stock FROM products WHERE id IN ({placeholders});", pids)
+        stock_by_product = {row["id"]: row["stock"] for row in cur.fetchall()}
+        names = {item["product_id"]: item["name"] for item in cart_items}
+        for pid, qty in qty_by_product.items():
+            stock = stock_by_product.get(pid)
+            if stock is None:
+                raise ValueError(f"Product not found (id={pid})")
+            if pending:
+                stock -= pending.get(pid, 0.0)
+            if stock < qty:
+                raise ValueError(
+                    f"Insufficient stock for {names[pid]} "
+                    f"(available {stock}, requested {qty})"
+                )
+
+    def get_invoices_between_dates(self, start: date, end: date):
+        return list(self.iter_invoices_between_dates(start, end))
+
+    def iter_invoices_between_dates(self, start: date, end: date):
+        """Yield invoices in [start, end] (live and archived), oldest first.
+
+        One query per database, archives first: they hold everything before
+        the archive cutoff, so database order is time order.
+        """
+        params = (f"{start.isoformat()} 00:00:00", f"{end.isoformat()} 23:59:59")
+        for schema in self._iter_invoice_sources(start, end):
+            cur = self.conn.cursor()
+            try:
+                cur.execute(
+                    f"""
+                    SELECT inv.*, customers.name AS customer_name
+                      FROM {schema}.invoices AS inv
+                 LEFT JOIN main.customers AS customers ON inv.customer_id = customers.id
+                     WHERE inv.datetime BETWEEN ? AND ?
+                  ORDER BY inv.datetime ASC;
+                    """,
+                    params,
+                )
+                yield from cur
+            finally:
+                cur.close()
+
+    def get_invoice_totals_between_dates(self, start: date, end: date) -> dict:
+        """invoice_count, subtotal, discount, tax_total, grand_total for [start, end]."""
+        cur = self.conn.cursor()
+        params = (f"{start.isoformat()} 00:00:00", f"{end.isoformat()} 23:59:59")
+        keys = ("invoice_count", "subtotal", "discount", "tax_total", "grand_total")
+        totals = dict.fromkeys(keys, 0)
+        for schema in self._iter_invoice_sources(start, end):
+            cur.execute(
+                f"""
+                SELECT COUNT(*), TOTAL(subtotal), TOTAL(discount), TOTAL(tax_total), TOTAL(grand_total)
+                  FROM {schema}.invoices
+                 WHERE datetime BETWEEN ? AND ?;
+                """,
+                params,
+            )
+            for key, value in zip(keys, cur.fetchone()):
+                totals[key] += value
+        return totals
 
     def get_invoice_items(self, invoice_id: int):
+        cur = self.conn.cursor()
+        # Live database first, then the archives from the newest year back (one attached at a time)
+        for year in [None] + list(reversed(self.get_archive_years())):
+            schema = "main" if year is None else self._attach_archive(year)
+            cur.execute(
+                f"""
+                SELECT * FROM {schema}.invoice_items
+                 WHERE invoice_id = ?
+              ORDER BY id ASC;
+                """,
+                (invoice_id,),
+            )
+            rows = cur.fetchall()
+            if rows:
+                return rows
+        return []
+
+    def iter_invoice_receipts(self, first_id: int, last_id: int):
+        """Yield (invoice, lines) for invoice ids first_id..last_id, archives included.
+
+        ``invoice`` carries customer_name; two ordered range scans per
+        database, merged, rather than one items query per invoice.
+        """
+        cur = self.conn.cursor()
+        items_cur = self.conn.cursor()
+        for year in self.get_archive_years() + [None]:
+            schema = "main" if year is None else self._attach_archive(year)
+            cur.execute(
+                f"""
+                SELECT invoices.*, customers.name AS customer_name
+                  FROM {schema}.invoices AS invoices
+             LEFT JOIN main.customers AS customers ON customers.id = invoices.customer_id
+                 WHERE invoices.id BETWEEN ? AND ?
+              ORDER BY invoices.id;
+                """,
+                (first_id, last_id),
+            )
+            items_cur.execute(
+                f"""
+                SELECT * FROM {schema}.invoice_items
+                 WHERE invoice_id BETWEEN ? AND ?
+              ORDER BY invoice_id, id;
+                """,
+                (first_id, last_id),
+            )
+            groups = itertools.groupby(items_cur, key=lambda row: row["invoice_id"])
+            group_id, group = next(groups, (None, ()))
+            for invoice in cur:
+                while group_id is not None and group_id < invoice["id"]:
+                    group_id, group = next(groups, (None, ()))
+                yield invoice, list(group) if group_id == invoice["id"] else []
+        # --- PATCH: Dashboard Data Methods ---
+
+    # ----- History archive ----- #
+
+    # Closed periods move to <db name>_archive_<year>.db next to the live file.
+    # Archives are ATTACHed on demand (as archive_<year>) when a query's date
+    # range reaches them, and queries visit them one at a time. SQLite allows
+    # 10 attached databases per connection, so the least recently used ones
+    # are DETACHed beyond ARCHIVE_ATTACH_LIMIT.
+    ARCHIVE_SCHEMA_PREFIX = "archive_"
+    ARCHIVE_ATTACH_LIMIT = 6
+
+    def archive_path(self, year: int) -> str:
+        return f"{os.path.splitext(self.path)[0]}_archive_{year}.db"
+
+    def get_archive_years(self) -> List[int]:
+        if self.path == ":memory:":
+            return []
+        base = os.path.basename(os.path.splitext(self.path)[0])
+        folder = os.path.dirname(os.path.abspath(self.path))
+        pattern = re.compile(re.escape(base) + r"_archive_(\d{4})\.db$")
+        years = []
+        for name in os.listdir(folder):
+            m = pattern.match(name)
+            if m:
+                years.append(int(m.group(1)))
+        return sorted(years)
+
+    def _attach_archive(self, year: int, create: bool = False) -> str:
+        schema = f"{self.ARCHIVE_SCHEMA_PREFIX}{year}"
+        cur = self.conn.cursor()
+        if schema in self._attached_archives:
+            self._attached_archives.remove(schema)
+        else:
+            self._detach_archives(self.ARCHIVE_ATTACH_LIMIT - 1)
+            cur.execute(f"ATTACH DATABASE ? AS {schema};", (self.archive_path(year),))
+        self._attached_archives.append(schema)  # most recently used last
+        if create:
+            # Same DDL as the live tables, so rows copy across column for column
+            for table in ("invoices", "invoice_items"):
+                cur.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?;", (table,))
+                ddl = re.sub(
+                    r'^CREATE TABLE\s+"?' + table + r'"?',
+                    f"CREATE TABLE IF NOT EXISTS {schema}.{table}",
+                    cur.fetchone()[0],
+                )
+                cur.execute(ddl)
+            cur.execute(
+                f"CREATE INDEX IF NOT EXISTS {schema}.idx_invoices_datetime ON invoices (datetime, grand_total);"
+            )
+            cur.execute(
+                f"CREATE INDEX IF NOT EXISTS {schema}.idx_invoice_items_invoice "
+                "ON invoice_items (invoice_id, product_id, quantity);"
+            )
+        return schema
+
+    def _detach_archives(self, keep: int = 0) -> None:
+        """DETACH least recently used archives until at most ``keep`` stay attached."""
+        for schema in list(self._attached_archives):
+            if len(self._attached_archives) <= keep:
+                break
+            try:
+                self.conn.execute(f"DETACH DATABASE {schema};")
+            except sqlite3.OperationalError:
+                continue  # an open cursor is still reading it
+            self._attached_archives.remove(schema)
+
+    def _iter_invoice_sources(self, start: Optional[date] = None, end: Optional[date] = None):
+        """Yield the schemas that may hold invoices in [start, end]: overlapping archives, then main.
+
+        Each archive is attached only when the caller moves on to it.
+        """
+        for year in self.get_archive_years():
+            if (start is None or year >= start.year) and (end is None or year <= end.year):
+                yield self._attach_archive(year)
+        yield "main"
+
+    def archive_invoices(self, before: date, vacuum: bool = True) -> dict:
+        """Move invoices dated before ``before`` (and their lines) into per-year archives.
+
+        Each year moves in one transaction; rows are copied with INSERT OR
+        IGNORE first, so a run interrupted between the archive and live
+        commits is completed by simply running it again. The daily rollups
+        stay in the live file, so dashboards still cover archived days.
+        Returns {year: invoices moved}.
+        """
+        if self.path == ":memory:":
+            raise ValueError("Archiving needs a database file")
+        cutoff = f"{before.isoformat()} 00:00:00"
+        cur = self.conn.cursor()
+        cur.execute(
+            "SELECT DISTINCT CAST(SUBSTR(datetime, 1, 4) AS INTEGER) FROM invoices WHERE datetime < ?;",
+            (cutoff,),
+        )
+        years = sorted(row[0] for row in cur.fetchall())
+
+        moved = {}
+        for year in years:
+            schema = self._attach_archive(year, create=True)
+            window = (f"{year}-01-01 00:00:00", min(cutoff, f"{year + 1}-01-01 00:00:00"))
+            in_window = "SELECT id FROM main.invoices WHERE datetime >= ? AND datetime < ?"
+            with self.conn:
+                cur.execute("BEGIN IMMEDIATE;")
+                cur.execute(
+                    f"INSERT OR IGNORE INTO {schema}.invoices "
+                    "SELECT * FROM main.invoices WHERE datetime >= ? AND datetime < ?;",
+                    window,
+                )
+                cur.execute(
+                    f"INSERT OR IGNORE INTO {schema}.invoice_items "
+                    f"SELECT * FROM main.invoice_items WHERE invoice_id IN ({in_window});",
+                    window,
+                )
+                cur.execute(f"DELETE FROM main.invoice_items WHERE invoice_id IN ({in_window});", window)
+                cur.execute("DELETE FROM main.invoices WHERE datetime >= ? AND datetime < ?;", window)
+                moved[year] = cur.rowcount
+
+        previous = self.get_setting("archived_before") or ""
+        if before.isoformat() > previous:
+            self.set_setting("archived_before", before.isoformat())
+        if vacuum and moved:
+            # Give the freed pages back so the live file (and its backups) shrink
+            self.conn.execute("VACUUM main;")
+            self.conn.execute("PRAGMA main.wal_checkpoint(TRUNCATE);")
+        return moved
+
+    def get_data_version(self) -> tuple:
+        """Changes whenever any connection (this one included) commits to the database.
+
+        Only comparable between calls on the same Database object.
+        """
+        cur = self.conn.cursor()
+        cur.execute("PRAGMA data_version;")
+        return self.conn.total_changes, cur.fetchone()[0]
+
+    def get_stock_at_risk(self, limit: int = 30):
+        """Active products with the lowest stock / restock_level ratio, most at risk first."""
         cur = self.conn.cursor()
         cur.execute(
             """
-            SELECT * FROM invoice_items
-             WHERE invoice_id = ?
-          ORDER BY id ASC;
+            SELECT name, stock, restock_level,
+                   CASE WHEN restock_level > 0 THEN stock / restock_level END AS ratio
+              FROM products
+             WHERE active = 1
+          ORDER BY ratio IS NULL, ratio ASC, name ASC
+             LIMIT ?;
             """,
-            (invoice_id,),
+            (limit,),
         )
         return cur.fetchall()
-        # --- PATCH: Dashboard Data Methods ---
 
-    def get_stock_levels(self):
+    def get_stock_by_category(self):
+        """Per-category stock rollup: products, stock, restock levels and how many are below them."""
         cur = self.conn.cursor()
         cur.execute("""
-            SELECT name, category, stock, restock_level
+            SELECT IFNULL(category, 'Uncategorized') AS category,
+                   COUNT(*) AS products,
+                   TOTAL(stock) AS stock,
+                   TOTAL(restock_level) AS restock_level,
+                   TOTAL(stock <= restock_level) AS below_restock
               FROM products
              WHERE active = 1
-             ORDER BY category, name;
+          GROUP BY IFNULL(category, 'Uncategorized')
+          ORDER BY category;
         """)
         return cur.fetchall()
 
     def get_sales_trend(self, days: int = 30):
         """Return list of (date, total_sales) for last N days."""
         cur = self.conn.cursor()
-        start_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d 00:00:00")
+        start_day = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
         cur.execute(
             """
-            SELECT DATE(datetime) AS day, SUM(grand_total) AS total
-              FROM invoices
-             WHERE datetime >= ?
-             GROUP BY DATE(datetime)
-             ORDER BY DATE(datetime);
+            SELECT day, grand_total AS total
+              FROM sales_daily
+             WHERE day >= ?
+             ORDER BY day;
             """,
-            (start_date,),
+            (start_day,),
         )
         return cur.fetchall()
 
     def get_stock_trend(self, days: int = 30):
-        """Approximate stock trend from historical average per product."""
+        """Return list of (date, total_stock) closing stock for each of the last N days.
+
+        Read from the daily checkpoints; days without movements carry the
+        previous close forward. Days before the ledger was opened are left out.
+        """
+        cur = self.conn.cursor()
+        start = date.today() - timedelta(days=days)
+        start_day = start.isoformat()
+        cur.execute(
+            "SELECT total_stock FROM stock_daily WHERE day < ? ORDER BY day DESC LIMIT 1;",
+            (start_day,),
+        )
+        row = cur.fetchone()
+        current = row["total_stock"] if row else None
+        cur.execute(
+            "SELECT day, total_stock FROM stock_daily WHERE day >= ? ORDER BY day;",
+            (start_day,),
+        )
+        closes = {r["day"]: r["total_stock"] for r in cur.fetchall()}
+
+        trend = []
+        for offset in range(days + 1):
+            day = (start + timedelta(days=offset)).isoformat()
+            current = closes.get(day, current)
+            if current is not None:
+                trend.append((day, current))
+        return trend
+
+    def get_stock_at(self, when: datetime, product_id: Optional[int] = None) -> float:
+        """Stock of one product (or the whole store) as of ``when``.
+
+        One seek on the (product_id, ts) ledger index for a product, or on
+        the daily checkpoints for the store total (as of the end of that day).
+        """
+        cur = self.conn.cursor()
+        if product_id is None:
+            cur.execute(
+                "SELECT total_stock FROM stock_daily WHERE day <= ? ORDER BY day DESC LIMIT 1;",
+                (when.strftime("%Y-%m-%d"),),
+            )
+        else:
+            cur.execute(
+                """
+                SELECT balance_after FROM stock_movements
+                 WHERE product_id = ? AND ts <= ?
+                 ORDER BY ts DESC, id DESC
+                 LIMIT 1;
+                """,
+                (product_id, when.strftime("%Y-%m-%d %H:%M:%S")),
+            )
+        row = cur.fetchone()
+        return row[0] if row else 0.0
+
+    def get_stock_movements(self, product_id: int, start: Optional[datetime] = None):
+        """Ledger rows for one product, oldest first (optionally from ``start``)."""
         cur = self.conn.cursor()
         cur.execute(
             """
-            SELECT DATE('now', '-' || ? || ' day') AS start_date, AVG(stock) AS avg_stock
-              FROM products
-             WHERE active = 1;
+            SELECT ts, delta, balance_after, reason, ref_id
+              FROM stock_movements
+             WHERE product_id = ? AND ts >= ?
+             ORDER BY ts, id;
             """,
-            (days,),
+            (product_id, start.strftime("%Y-%m-%d %H:%M:%S") if start else ""),
         )
-        avg_stock = cur.fetchone()
-        if avg_stock and avg_stock["avg_stock"] is not None:
-            return [(datetime.now().strftime("%Y-%m-%d"), avg_stock["avg_stock"])]
-        return []
+        return cur.fetchall()
 
         # ----- Settings operations ----- #
     def get_setting(self, key: str) -> Optional[str]:
@@ -598,21 +1732,171 @@ class Database:
         """)
         return cur.fetchall()
 
-    def get_sales_details(self, last_days: int = 30):
-        """Detailed sales lines for AI analytics."""
+    # Column headers for iter_sales_export, invoice level and line level
+    EXPORT_INVOICE_COLUMNS = (
+        "Invoice ID", "DateTime", "Customer", "Subtotal", "Discount", "Tax", "Total", "Payment Method",
+    )
+    EXPORT_LINE_COLUMNS = (
+        "Invoice ID", "DateTime", "Customer", "Product Code", "Product", "Qty",
+        "Unit Price", "Tax Rate", "Line Total", "Payment Method",
+    )
+
+    def iter_sales_export(self, start: Optional[date] = None, end: Optional[date] = None,
+                          lines: bool = False, chunk_rows: int = EXPORT_CHUNK_ROWS):
+        """Yield invoices (or invoice lines) in datetime order as lists of up to chunk_rows rows.
+
+        Archived years come first, then the live database, so exports never
+        hold more than one chunk of the history in memory.
+        """
+        clauses, params = [], []
+        if start is not None:
+            clauses.append("invoices.datetime >= ?")
+            params.append(f"{start.isoformat()} 00:00:00")
+        if end is not None:
+            clauses.append("invoices.datetime <= ?")
+            params.append(f"{end.isoformat()} 23:59:59")
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        # Archives hold everything before the cutoff, so schema order is time order
+        for schema in self._iter_invoice_sources(start, end):
+            cur = self.conn.cursor()
+            if lines:
+                cur.execute(
+                    f"""
+                    SELECT invoices.id, invoices.datetime, customers.name AS customer,
+                           invoice_items.product_code, invoice_items.product_name, invoice_items.quantity,
+                           invoice_items.unit_price, invoice_items.tax_rate, invoice_items.line_total,
+                           invoices.payment_method
+                      FROM {schema}.invoices AS invoices
+                      JOIN {schema}.invoice_items AS invoice_items ON invoice_items.invoice_id = invoices.id
+                 LEFT JOIN main.customers AS customers ON invoices.customer_id = customers.id
+                     {where}
+                  ORDER BY invoices.datetime, invoices.id, invoice_items.id;
+                    """,
+                    params,
+                )
+            else:
+                cur.execute(
+                    f"""
+                    SELECT invoices.id, datetime, customers.name AS customer, subtotal, discount,
+                           tax_total, grand_total, payment_method
+                      FROM {schema}.invoices AS invoices
+                 LEFT JOIN main.customers AS customers ON invoices.customer_id = customers.id
+                     {where}
+                  ORDER BY datetime, invoices.id;
+                    """,
+                    params,
+                )
+            while True:
+                rows = cur.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                yield rows
+
+    def get_max_invoice_id(self) -> int:
+        """Highest invoice id written so far, archived invoices included."""
+        cur = self.conn.cursor()
+        top = 0
+        for schema in self._iter_invoice_sources():
+            cur.execute(f"SELECT IFNULL(MAX(id), 0) FROM {schema}.invoices;")
+            top = max(top, cur.fetchone()[0])
+        return top
+
+    def iter_history_rows(self, after_id: int, upto_id: int, lines: bool = False,
+                          chunk_rows: int = EXPORT_CHUNK_ROWS):
+        """Yield raw invoices (or invoice lines) with after_id < invoice id <= upto_id, in chunks.
+
+        Archived years first, then the live database, each in invoice id
+        order, with the invoice month ("YYYY-MM") as the first column, ready
+        for month-partitioned archives.
+        """
+        for schema in self._iter_invoice_sources():
+            cur = self.conn.cursor()
+            if lines:
+                cur.execute(
+                    f"""
+                    SELECT SUBSTR(invoices.datetime, 1, 7) AS month, invoice_items.*
+                      FROM {schema}.invoice_items AS invoice_items
+                      JOIN {schema}.invoices AS invoices ON invoice_items.invoice_id = invoices.id
+                     WHERE invoice_items.invoice_id > ? AND invoice_items.invoice_id <= ?
+                  ORDER BY invoice_items.invoice_id, invoice_items.id;
+                    """,
+                    (after_id, upto_id),
+                )
+            else:
+                cur.execute(
+                    f"""
+                    SELECT SUBSTR(datetime, 1, 7) AS month, *
+                      FROM {schema}.invoices
+                     WHERE id > ? AND id <= ?
+                  ORDER BY id;
+                    """,
+                    (after_id, upto_id),
+                )
+            while True:
+                rows = cur.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                yield rows
+
+    def get_product_daily_quantities(self, start: date, end: date) -> list:
+        """(day offset from start, product ids, quantities in thousandths) per day, start <= day < end.
+
+        Ids and quantities come as comma-separated integer lists, one row per
+        day rather than per (day, product), so a 90-day window of a large
+        catalog is a few dozen strings NumPy parses in bulk instead of
+        hundreds of thousands of Python tuples. Both lists are built from the
+        same rows in the same order, so they line up position by position.
+        """
+        cur = self.conn.cursor()
+        cur.row_factory = None
+        cur.execute(
+            """
+            SELECT CAST(julianday(day) - julianday(?) AS INTEGER),
+                   group_concat(product_id),
+                   group_concat(CAST(ROUND(quantity * 1000) AS INTEGER))
+              FROM sales_daily_product
+             WHERE day >= ? AND day < ?
+          GROUP BY day;
+            """,
+            (start.isoformat(), start.isoformat(), end.isoformat()),
+        )
+        return cur.fetchall()
+
+    def get_product_sales_ranking(self, last_days: int = 30, limit: int = 5, ascending: bool = False):
+        """(product, qty) for products sold in the window, best (or slowest) sellers first."""
+        order = "ASC" if ascending else "DESC"
+        cur = self.conn.cursor()
+        start_day = (datetime.now() - timedelta(days=last_days)).strftime("%Y-%m-%d")
+        cur.execute(
+            f"""
+            SELECT products.name AS product, SUM(sales_daily_product.quantity) AS qty
+              FROM sales_daily_product
+              JOIN products ON sales_daily_product.product_id = products.id
+             WHERE sales_daily_product.day >= ?
+          GROUP BY sales_daily_product.product_id
+          ORDER BY qty {order}, product ASC
+             LIMIT ?;
+            """,
+            (start_day, limit),
+        )
+        return cur.fetchall()
+
+    def get_top_customers(self, last_days: int = 30, limit: int = 5):
+        """(customer, total) for the biggest spenders in the window (walk-in sales excluded)."""
         cur = self.conn.cursor()
+        start_day = (datetime.now() - timedelta(days=last_days)).strftime("%Y-%m-%d")
         cur.execute(
             """
-            SELECT products.name AS product,
-                   invoice_items.quantity AS qty,
-                   DATE(invoices.datetime) AS day
-              FROM invoice_items
-              JOIN products ON invoice_items.product_id = products.id
-              JOIN invoices ON invoice_items.invoice_id = invoices.id
-             WHERE invoices.datetime >= DATE('now', ?)
-          ORDER BY invoices.datetime ASC;
+            SELECT customers.name AS customer, SUM(sales_daily_customer.grand_total) AS total
+              FROM sales_daily_customer
+              JOIN customers ON sales_daily_customer.customer_id = customers.id
+             WHERE sales_daily_customer.day >= ?
+          GROUP BY sales_daily_customer.customer_id
+          ORDER BY total DESC, customer ASC
+             LIMIT ?;
             """,
-            (f"-{last_days} day",),
+            (start_day, limit),
         )
         return cur.fetchall()
 
@@ -665,12 +1949,570 @@ class Database:
 
 
 
-# --- PATCH START: Sound Feedback Class ---
-# --- PATCH START: Real-Time Stock Alerts + Enhanced SoundManager ---
+# --------- Write-behind invoice journal --------- #
+#
+# With `--journal FILE`, a checkout is validated, given an id and appended
+# (fsync'd) to a JSON-lines journal, and the till moves on. A writer thread
+# group-commits the queued invoices to SQLite, one transaction per batch, and
+# trims the journal once everything in it is in the database. Entries left
+# after a crash are replayed on the next start; replay skips invoice ids that
+# already made it in, so it is safe to repeat.
+#
+# Meant for one process per database file (a till on its own file, or the
+# checkout service): pending sales are only known to the process that took
+# them. Sharing the file with other writing tills is unsupported: ids reserved
+# in blocks can then commit after higher ids from those tills, and the
+# id watermark of export_sales_history would skip them.
+#
+# The writer connection runs synchronous=FULL whatever the till's profile,
+# because the journal is trimmed as soon as a batch commits: the commit itself
+# has to survive a power cut.
+
+INVOICE_ID_BLOCK = 50  # invoice ids reserved per round trip to the database
+JOURNAL_STATUS_INTERVAL_MS = 1000  # how often the till checks the writer's health
+JOURNAL_BACKLOG_WARNING = 500  # queued sales before the till warns even without an error
+
+
+class InvoiceWriteQueue:
+    """Durable write-behind queue for invoices, committed in batches by a writer thread."""
+
+    def __init__(self, db: Database, journal_path: str, batch_size: int = 200,
+                 fsync: bool = True, on_commit=None) -> None:
+        if db.path == ":memory:":
+            raise ValueError("The invoice journal needs a database file")
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.fsync = fsync
+        # Called on the writer thread with the product ids of each committed batch
+        self.on_commit = on_commit
+        self.last_error: Optional[str] = None
+        self._writer_db = Database(db.path, {**db.profile, "synchronous": "FULL"}, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._pending: dict[int, float] = {}   # product_id -> quantity queued, not yet committed
+        self._in_flight = 0
+        self._ids: list = []   # reserved invoice ids, next first
+        self._queue: queue.Queue = queue.Queue()
+
+        self.replay()
+        self._journal = open(journal_path, "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._run, name="invoice-writer", daemon=True)
+        self._thread.start()
+
+    def replay(self) -> int:
+        """Write any journaled invoices missing from the database; return how many."""
+        if not os.path.exists(self.journal_path):
+            return 0
+        invoices = []
+        with open(self.journal_path, encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    invoices.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break  # torn last line: that checkout never got its receipt
+        written = self._commit(invoices, settle=False)
+        open(self.journal_path, "w").close()
+        return written
+
+    def create_invoice(self, db: Database, **kwargs):
+        """Same contract as Database.create_invoice, returning once the sale is journaled.
+
+        ``db`` is the caller's connection, used for the stock check (which also
+        counts sales still in the queue) and to reserve invoice ids.
+        """
+        while True:
+            with self._lock:
+                if self._ids:
+                    invoice = db.prepare_invoice(**kwargs, pending=self._pending)
+                    invoice["invoice_id"] = self._ids[0]
+                    self._journal.write(json.dumps(invoice) + "\n")
+                    self._journal.flush()
+                    if self.fsync:
+                        os.fsync(self._journal.fileno())
+                    # Only consume the id once the entry is durable
+                    self._ids.pop(0)
+                    for pid, qty in Database._invoice_quantities(invoice).items():
+                        self._pending[pid] = self._pending.get(pid, 0.0) + qty
+                    self._in_flight += 1
+                    break
+            # Reserve outside the lock: this waits for the database write lock,
+            # which the writer may hold until it can take self._lock to commit.
+            block = db.reserve_invoice_ids(INVOICE_ID_BLOCK)
+            with self._lock:
+                self._ids.extend(block)
+        self._queue.put(invoice)
+        return invoice["invoice_id"], Database.invoice_totals(invoice)
+
+    def get_reorder_suggestions(self, db: Database, product_ids) -> list:
+        """db.get_reorder_suggestions(product_ids) counting queued sales as sold.
+
+        Committed stock and the pending quantities are read under the lock the
+        writer commits under, so each sale counts exactly once without waiting
+        for the writer.
+        """
+        with self._lock:
+            db.invalidate_product_cache(product_ids)
+            return db.get_reorder_suggestions(product_ids, pending=self._pending)
+
+    def status(self) -> dict:
+        """Writer health for the till: invoices not yet in the database, last error, thread alive."""
+        with self._lock:
+            backlog = self._in_flight
+        return {"backlog": backlog, "error": self.last_error, "alive": self._thread.is_alive()}
+
+    def close(self, db: Optional[Database] = None) -> None:
+        """Drain the queue and stop the writer; ``db`` hands back unused reserved ids."""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(None)
+        self._thread.join()
+        with self._lock:
+            self._journal.close()
+            ids, self._ids = self._ids, []
+        if db is not None and ids and ids[-1] - ids[0] + 1 == len(ids):
+            db.release_invoice_ids(range(ids[0], ids[-1] + 1))
+
+    def _run(self) -> None:
+        import time
+
+        while True:
+            batch = [self._queue.get()]
+            # Group commit: take everything that queued up during the last write
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            batch = [invoice for invoice in batch if invoice is not None]
+            while batch:
+                try:
+                    self._commit(batch)
+                    self.last_error = None
+                    break
+                except Exception as e:
+                    # Still in the journal; keep retrying (the file may be locked by a long
+                    # write) and let the till show the error meanwhile (see status())
+                    self.last_error = f"{type(e).__name__}: {e}"
+                    if stop:
+                        return  # left for replay on the next start
+                    time.sleep(1.0)
+            if stop:
+                return
+
+    def _commit(self, invoices: list, settle: bool = True) -> int:
+        """Write a batch in one transaction; return how many were new.
+
+        ``settle`` releases the batch's pending stock and journal entries
+        (replay runs before anything is pending).
+        """
+        conn = self._writer_db.conn
+        cur = conn.cursor()
+        written = 0
+        product_ids: set = set()
+        cur.execute("BEGIN IMMEDIATE;")
+        try:
+            for invoice in invoices:
+                cur.execute("SELECT 1 FROM invoices WHERE id = ?;", (invoice["invoice_id"],))
+                if cur.fetchone() is None:
+                    self._writer_db._write_invoice(cur, invoice, guarded=False)
+                    written += 1
+                product_ids.update(pid for pid, *_rest in invoice["lines"])
+        except Exception:
+            conn.rollback()
+            raise
+        with self._lock:
+            # Commit and un-pend together, so the stock check never counts a sale twice
+            conn.commit()
+            if settle:
+                for invoice in invoices:
+                    for pid, qty in Database._invoice_quantities(invoice).items():
+                        left = self._pending.get(pid, 0.0) - qty
+                        if left > 1e-9:
+                            self._pending[pid] = left
+                        else:
+                            self._pending.pop(pid, None)
+                self._in_flight -= len(invoices)
+                if self._in_flight == 0:
+                    # Everything journaled is in the database
+                    try:
+                        self._journal.truncate(0)
+                    except OSError as e:
+                        # Harmless: replay skips invoices that are already written
+                        print(f"Could not trim invoice journal: {e}", file=sys.stderr)
+        if settle and self.on_commit is not None and product_ids:
+            try:
+                self.on_commit(sorted(product_ids))
+            except Exception as e:
+                # The batch is committed and settled; it must not be retried
+                print(f"Invoice commit callback failed: {e}", file=sys.stderr)
+        return written
+
+
+# --------- Checkout Service (multi-till) --------- #
+#
+# `python supermarket_pos.py --serve` runs a headless service that owns the
+# Database and exposes a small JSON/HTTP API. Tills started with
+# `--server http://host:8765` use RemoteDatabase as a thin client, so only the
+# service touches supermarket.db: writes are serialized in one process and
+# reads are spread over a pool of reader connections.
+#
+# The API has no authentication: anyone who can reach the port can ring up
+# sales, restock and change settings. Bind it to 127.0.0.1 or to a till-only
+# LAN (--host 0.0.0.0 behind the shop router), never to a wider network.
+# Prices and tax rates are always taken from the service's own catalog.
 
-LOW_STOCK_THRESHOLD = 5  # units
+SERVICE_DEFAULT_PORT = 8765
 
 
+class CheckoutService:
+    """Owns the writer connection (behind a lock) and a pool of readers.
+
+    With a journal, checkouts go through an InvoiceWriteQueue instead of
+    one transaction each.
+    """
+
+    def __init__(self, path: str = "supermarket.db", pool_size: int = 4,
+                 journal: Optional[str] = None) -> None:
+        self.db = Database(path, check_same_thread=False)
+        self.write_lock = threading.Lock()
+        # Barcode lookups get their own connection and lock, so scans never
+        # wait behind a checkout commit; its cache follows PRAGMA data_version.
+        self.catalog = self.db.open_reader()
+        self.catalog_lock = threading.Lock()
+        self.readers: queue.Queue = queue.Queue()
+        for _ in range(max(1, pool_size)):
+            self.readers.put(self.db.open_reader())
+        self.invoices = (
+            InvoiceWriteQueue(self.db, journal, on_commit=self._on_invoices_committed) if journal else None
+        )
+
+    @contextlib.contextmanager
+    def reader(self):
+        conn_db = self.readers.get()
+        try:
+            yield conn_db
+        finally:
+            self.readers.put(conn_db)
+
+    def get_product_by_code(self, code: str):
+        with self.catalog_lock:
+            return self.catalog.get_product_by_code(code)
+
+    def _priced_cart(self, cart_items: list) -> list:
+        """Replace client-sent code, name, price and tax rate with the catalog's."""
+        priced = []
+        with self.catalog_lock:
+            for item in cart_items:
+                product = self.catalog.get_product_by_id(int(item["product_id"]))
+                if product is None:
+                    raise ValueError(f"Product {item['product_id']} is not available")
+                priced.append({
+                    "product_id": product["id"],
+                    "code": product["code"],
+                    "name": product["name"],
+                    "price": product["price"],
+                    "tax_rate": product["tax_rate"],
+                    "quantity": float(item["quantity"]),
+                })
+        return priced
+
+    def create_invoice(self, **kwargs):
+        kwargs["cart_items"] = self._priced_cart(kwargs["cart_items"])
+        with self.write_lock:
+            if self.invoices is not None:
+                return self.invoices.create_invoice(self.db, **kwargs)
+            return self.db.create_invoice(**kwargs)
+
+    def _on_invoices_committed(self, product_ids: list) -> None:
+        with self.write_lock:
+            self.db.invalidate_product_cache(product_ids)
+
+    def close(self) -> None:
+        # Not under write_lock: the writer needs it to finish its last batch
+        if self.invoices is not None:
+            self.invoices.close(self.db)
+
+    def get_reorder_plan(self, product_ids=None) -> list:
+        with self.write_lock:
+            return self.db.get_reorder_plan(product_ids)
+
+    def restock_products(self, restock_data: dict) -> None:
+        with self.write_lock:
+            self.db.restock_products(restock_data)
+
+    def set_setting(self, key: str, value: str) -> None:
+        with self.write_lock:
+            self.db.set_setting(key, value)
+
+
+def _row_to_dict(row):
+    return dict(row) if row is not None else None
+
+
+class _ServiceRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, one connection per till
+    service: CheckoutService = None  # set by serve()
+
+    def log_message(self, fmt, *args):  # keep the console quiet
+        pass
+
+    def _send_json(self, status: int, payload) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _dispatch(self, method: str) -> None:
+        url = urlparse(self.path)
+        parts = [unquote(p) for p in url.path.strip("/").split("/")]
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            status, payload = self._route(method, parts, query)
+        except ValueError as e:
+            # Business rule violations (stock, payment, duplicates)
+            status, payload = 409, {"error": str(e)}
+        except Exception as e:
+            status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+        self._send_json(status, payload)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def _route(self, method: str, parts: list, query: dict):
+        svc = self.service
+        if parts[:1] != ["api"]:
+            return 404, {"error": "not found"}
+        parts = parts[1:]
+        active_only = query.get("active_only", "1") != "0"
+
+        if method == "GET" and parts == ["products"]:
+            with svc.reader() as db:
+                if query.get("ids") is not None:
+                    rows = db.get_products_by_ids(int(pid) for pid in query["ids"].split(",") if pid)
+                else:
+                    rows = db.get_products(active_only=active_only, search_text=query.get("search"))
+            return 200, [dict(r) for r in rows]
+
+        if method == "GET" and parts == ["products", "ids"]:
+            with svc.reader() as db:
+                return 200, db.search_product_ids(active_only=active_only, search_text=query.get("search"))
+
+        if method == "GET" and len(parts) == 3 and parts[:2] == ["products", "by-code"]:
+            row = svc.get_product_by_code(parts[2])
+            return (200, dict(row)) if row else (404, {"error": "not found"})
+
+        if method == "GET" and parts == ["customers"]:
+            with svc.reader() as db:
+                rows = db.get_customers(active_only=active_only, search_text=query.get("search"))
+            return 200, [dict(r) for r in rows]
+
+        if method == "POST" and parts == ["invoices"]:
+            data = self._read_json()
+            invoice_id, totals = svc.create_invoice(
+                customer_id=data.get("customer_id"),
+                cart_items=data["cart_items"],
+                global_discount_percent=float(data.get("global_discount_percent", 0.0)),
+                payment_method=data.get("payment_method", "Cash"),
+                paid_amount=float(data["paid_amount"]),
+                notes=data.get("notes", ""),
+            )
+            return 200, {"invoice_id": invoice_id, "totals": totals}
+
+        if method == "GET" and len(parts) == 3 and parts[0] == "invoices" and parts[2] == "items":
+            with svc.reader() as db:
+                rows = db.get_invoice_items(int(parts[1]))
+            return 200, [dict(r) for r in rows]
+
+        if method == "GET" and parts == ["reorder"]:
+            ids = [int(pid) for pid in query["ids"].split(",")] if query.get("ids") else None
+            return 200, [dict(r) for r in svc.get_reorder_plan(ids)]
+
+        if method == "POST" and parts == ["restock"]:
+            data = self._read_json()
+            svc.restock_products({int(pid): qty for pid, qty in data["restock"].items()})
+            return 200, {"ok": True}
+
+        if method == "GET" and parts == ["reports", "invoices"]:
+            start = date.fromisoformat(query["start"])
+            end = date.fromisoformat(query["end"])
+            with svc.reader() as db:
+                rows = db.get_invoices_between_dates(start, end)
+            return 200, [dict(r) for r in rows]
+
+        if method == "GET" and parts == ["reports", "sales-trend"]:
+            with svc.reader() as db:
+                rows = db.get_sales_trend(int(query.get("days", 30)))
+            return 200, [dict(r) for r in rows]
+
+        if len(parts) == 2 and parts[0] == "settings":
+            if method == "GET":
+                with svc.reader() as db:
+                    return 200, {"key": parts[1], "value": db.get_setting(parts[1])}
+            if method == "PUT":
+                svc.set_setting(parts[1], str(self._read_json()["value"]))
+                return 200, {"ok": True}
+
+        return 404, {"error": "not found"}
+
+
+def serve(path: str = "supermarket.db", host: str = "127.0.0.1",
+          port: int = SERVICE_DEFAULT_PORT, pool_size: int = 4, journal: Optional[str] = None) -> None:
+    """Run the checkout service until interrupted (Ctrl+C)."""
+    handler = type("ServiceRequestHandler", (_ServiceRequestHandler,), {})
+    handler.service = CheckoutService(path, pool_size=pool_size, journal=journal)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    print(f"Checkout service for {path} listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        handler.service.close()
+
+
+class RemoteDatabase:
+    """Thin-client stand-in for Database, talking to a CheckoutService.
+
+    Implements the subset of the Database API the billing screen uses. Rows
+    come back as plain dicts, which BillingTab indexes the same way as
+    sqlite3.Row. Rejections from the service raise ValueError as locally.
+    """
+
+    def __init__(self, base_url: str, timeout: float = 10.0) -> None:
+        url = urlparse(base_url if "://" in base_url else f"http://{base_url}")
+        self.base_url = f"http://{url.hostname}:{url.port or SERVICE_DEFAULT_PORT}"
+        self._host = url.hostname
+        self._port = url.port or SERVICE_DEFAULT_PORT
+        self._timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self._host, self._port, timeout=self._timeout)
+            self._local.conn = conn
+        return conn
+
+    def _request(self, method: str, path: str, params: Optional[dict] = None, payload=None):
+        if params:
+            path += "?" + urlencode({k: v for k, v in params.items() if v is not None})
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        for attempt in (1, 2):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = json.loads(resp.read() or b"null")
+                break
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                self._local.conn = None
+                # Retry once on a dropped keep-alive connection, never a POST
+                if attempt == 2 or method == "POST":
+                    raise ValueError(f"Checkout service unreachable ({self.base_url}): {e}")
+        if resp.status == 404:
+            return None
+        if resp.status >= 400:
+            raise ValueError(data.get("error", f"HTTP {resp.status}"))
+        return data
+
+    def get_products(self, active_only: bool = True, search_text: Optional[str] = None):
+        return self._request(
+            "GET", "/api/products",
+            {"active_only": int(active_only), "search": search_text or None},
+        )
+
+    def iter_products(self, active_only: bool = True, search_text: Optional[str] = None):
+        return iter(self.get_products(active_only, search_text))
+
+    def search_product_ids(self, active_only: bool = True, search_text: Optional[str] = None) -> list:
+        return self._request(
+            "GET", "/api/products/ids",
+            {"active_only": int(active_only), "search": search_text or None},
+        )
+
+    def get_products_by_ids(self, ids) -> list:
+        ids = [str(int(pid)) for pid in ids]
+        return self._request("GET", "/api/products", {"ids": ",".join(ids)}) if ids else []
+
+    def open_reader(self) -> "RemoteDatabase":
+        # HTTP connections are already per thread
+        return self
+
+    def get_product_by_code(self, code: str):
+        return self._request("GET", "/api/products/by-code/" + quote(code, safe=""))
+
+    def get_reorder_plan(self, product_ids=None) -> list:
+        params = {"ids": ",".join(str(int(pid)) for pid in product_ids)} if product_ids is not None else None
+        return self._request("GET", "/api/reorder", params)
+
+    # Same filtering and ordering as the local database
+    get_reorder_suggestions = Database.get_reorder_suggestions
+
+    def get_customers(self, active_only: bool = True, search_text: Optional[str] = None):
+        return self._request(
+            "GET", "/api/customers",
+            {"active_only": int(active_only), "search": search_text or None},
+        )
+
+    def create_invoice(self, customer_id, cart_items, global_discount_percent,
+                       payment_method, paid_amount, notes):
+        data = self._request(
+            "POST",
+            "/api/invoices",
+            payload={
+                "customer_id": customer_id,
+                "cart_items": cart_items,
+                "global_discount_percent": global_discount_percent,
+                "payment_method": payment_method,
+                "paid_amount": paid_amount,
+                "notes": notes,
+            },
+        )
+        return data["invoice_id"], data["totals"]
+
+    def get_invoice_items(self, invoice_id: int):
+        return self._request("GET", f"/api/invoices/{int(invoice_id)}/items") or []
+
+    def get_invoices_between_dates(self, start: date, end: date):
+        return self._request(
+            "GET", "/api/reports/invoices", {"start": start.isoformat(), "end": end.isoformat()}
+        )
+
+    def get_sales_trend(self, days: int = 30):
+        return self._request("GET", "/api/reports/sales-trend", {"days": days})
+
+    def restock_products(self, restock_data: dict) -> None:
+        self._request(
+            "POST", "/api/restock", payload={"restock": {str(k): v for k, v in restock_data.items()}}
+        )
+
+    def get_setting(self, key: str) -> Optional[str]:
+        data = self._request("GET", "/api/settings/" + quote(key, safe=""))
+        return data["value"] if data else None
+
+    def set_setting(self, key: str, value: str) -> None:
+        self._request("PUT", "/api/settings/" + quote(key, safe=""), payload={"value": value})
+
+
+# --- PATCH START: Sound Feedback Class ---
+# --- PATCH START: Real-Time Stock Alerts + Enhanced SoundManager ---
+
 class SoundManager:
     """Manages success, error, and warning sounds."""
 
@@ -708,68 +2550,650 @@ class SoundManager:
             self.warning.play()
 # --- PATCH END ---
 
-# --- PATCH END ---
+# --- PATCH END ---
+
+
+# --- PATCH START: Auto-Restock Dialog ---
+
+class RestockDialog(QDialog):
+    """Popup dialog to restock multiple low-stock items.
+
+    low_items are reorder plan rows (Database.get_reorder_plan); each input
+    starts at the suggested order quantity.
+    """
+
+    def __init__(self, db: Database, low_items: list[sqlite3.Row], parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.low_items = low_items
+        self.restock_inputs = {}
+
+        self.setWindowTitle("Restock Low Inventory")
+        layout = QVBoxLayout(self)
+
+        layout.addWidget(QLabel("The following items are low on stock:"))
+        layout.addSpacing(10)
+
+        grid = QGridLayout()
+        grid.addWidget(QLabel("<b>Product</b>"), 0, 0)
+        grid.addWidget(QLabel("<b>Current</b>"), 0, 1)
+        grid.addWidget(QLabel("<b>Days Left</b>"), 0, 2)
+        grid.addWidget(QLabel("<b>Add</b>"), 0, 3)
+
+        for i, item in enumerate(low_items, start=1):
+            name_lbl = QLabel(item["name"])
+            stock_lbl = QLabel(f"{item['stock']:.2f}")
+            cover = item["days_of_cover"]
+            cover_lbl = QLabel("—" if cover is None else f"{cover:.1f}")
+            spin = QSpinBox()
+            spin.setRange(0, 10_000)
+            spin.setValue(int(item["suggested_qty"]))
+            grid.addWidget(name_lbl, i, 0)
+            grid.addWidget(stock_lbl, i, 1)
+            grid.addWidget(cover_lbl, i, 2)
+            grid.addWidget(spin, i, 3)
+            self.restock_inputs[item["id"]] = spin
+
+        layout.addLayout(grid)
+        layout.addSpacing(15)
+
+        btn_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        btn_box.accepted.connect(self.accept)
+        btn_box.rejected.connect(self.reject)
+        layout.addWidget(btn_box)
+
+        self.resize(450, 300)
+
+    def get_restock_data(self):
+        """Return dict {product_id: quantity_to_add}."""
+        return {pid: spin.value() for pid, spin in self.restock_inputs.items() if spin.value() > 0}
+
+# --- PATCH END ---
+
+# --------- Background DB reads --------- #
+
+class ReadJobContext:
+    """What a background job sees: its own DB connection plus cancel/batch hooks."""
+
+    def __init__(self, db, ticket: int, reader: "BackgroundReader", worker=None) -> None:
+        self.db = db
+        self.ticket = ticket
+        self._reader = reader
+        self._worker = worker
+
+    def cancelled(self) -> bool:
+        """True once a newer job replaced this one or it was cancelled."""
+        return self._reader.is_cancelled(self.ticket)
+
+    def emit_batch(self, rows) -> None:
+        """Hand partial results to the GUI thread (for progressive loading)."""
+        if self._worker is not None:
+            self._worker.batch_ready.emit(self.ticket, rows)
+        else:
+            self._reader._on_batch(self.ticket, rows)
+
+
+class _ReadWorker(QObject):
+    """Runs read jobs on a QThread against a connection opened in that thread."""
+
+    finished = Signal(int, object)
+    failed = Signal(int, str)
+    batch_ready = Signal(int, object)
+
+    def __init__(self, open_db, reader: "BackgroundReader") -> None:
+        super().__init__()
+        self._open_db = open_db
+        self._reader = reader
+        self._db = None
+
+    @Slot(int, object)
+    def run(self, ticket: int, job) -> None:
+        if self._reader.is_cancelled(ticket):
+            return  # superseded while queued
+        try:
+            if self._db is None:
+                self._db = self._open_db()
+            result = job(ReadJobContext(self._db, ticket, self._reader, self))
+        except Exception as e:
+            self.failed.emit(ticket, f"{type(e).__name__}: {e}")
+            return
+        self.finished.emit(ticket, result)
+
+
+class BackgroundReader(QObject):
+    """Runs DB read jobs off the GUI thread, one worker thread per owner.
+
+    submit(channel, job, on_result) queues job(ctx) on the worker; a newer
+    submit on the same channel cancels the older one, and results of
+    cancelled/superseded jobs are dropped instead of delivered. Callbacks
+    always run on the GUI thread. In-memory databases can't be opened twice,
+    so for those jobs run inline.
+    """
+
+    _submit = Signal(int, object)
+
+    def __init__(self, db, parent=None) -> None:
+        super().__init__(parent)
+        self.db = db
+        self._tickets = itertools.count(1)
+        self._latest: dict[str, int] = {}
+        self._callbacks: dict[int, tuple] = {}
+        self._cancelled: set[int] = set()
+        self._thread = None
+
+        if getattr(db, "path", None) == ":memory:":
+            return
+        self._thread = QThread()
+        self._worker = _ReadWorker(db.open_reader, self)
+        self._worker.moveToThread(self._thread)
+        self._submit.connect(self._worker.run)
+        self._worker.finished.connect(self._on_finished)
+        self._worker.failed.connect(self._on_failed)
+        self._worker.batch_ready.connect(self._on_batch)
+        self._thread.start()
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.shutdown)
+
+    def submit(self, channel: str, job, on_result, on_batch=None, on_error=None) -> int:
+        ticket = next(self._tickets)
+        previous = self._latest.get(channel)
+        if previous is not None:
+            self.cancel(previous)
+        self._latest[channel] = ticket
+        self._callbacks[ticket] = (on_result, on_batch, on_error)
+
+        if self._thread is None:
+            try:
+                result = job(ReadJobContext(self.db, ticket, self))
+            except Exception as e:
+                self._on_failed(ticket, f"{type(e).__name__}: {e}")
+            else:
+                self._on_finished(ticket, result)
+        else:
+            self._submit.emit(ticket, job)
+        return ticket
+
+    def cancel(self, ticket: int) -> None:
+        self._cancelled.add(ticket)
+        self._callbacks.pop(ticket, None)
+
+    def is_cancelled(self, ticket: int) -> bool:
+        return ticket in self._cancelled
+
+    def shutdown(self) -> None:
+        if self._thread is not None:
+            self._cancelled.update(self._callbacks)
+            self._thread.quit()
+            self._thread.wait()
+            self._thread = None
+
+    @Slot(int, object)
+    def _on_batch(self, ticket: int, rows) -> None:
+        callbacks = self._callbacks.get(ticket)
+        if callbacks and callbacks[1] is not None:
+            callbacks[1](rows)
+
+    @Slot(int, object)
+    def _on_finished(self, ticket: int, result) -> None:
+        callbacks = self._callbacks.pop(ticket, None)
+        self._cancelled.discard(ticket)
+        if callbacks is not None:
+            callbacks[0](result)
+
+    @Slot(int, str)
+    def _on_failed(self, ticket: int, message: str) -> None:
+        callbacks = self._callbacks.pop(ticket, None)
+        self._cancelled.discard(ticket)
+        if callbacks is None:
+            return
+        if callbacks[2] is not None:
+            callbacks[2](message)
+        else:
+            print(f"Background read failed: {message}", file=sys.stderr)
+
+
+SEARCH_DEBOUNCE_MS = 250  # wait for a pause in typing before querying
+REPORT_BATCH_ROWS = 2000  # invoices per batch streamed into the Reports grid
+
+
+# --------- Grid Model --------- #
+
+class RowTableModel(QAbstractTableModel):
+    """Read-only grid fed from a row iterator, an id list paged on demand, or batches.
+
+    With set_pages() the model holds only the ordered ids of the result and
+    asks a loader for the rows of the next PAGE_SIZE ids as the view scrolls
+    (canFetchMore/fetchMore); each page is its own short query, so no cursor
+    is left open between scrolls. Rows can also be pushed in batches with
+    append_rows(). Cell text is formatted on demand in data(), so a 40k-SKU
+    catalog or a quarter of invoices doesn't turn into hundreds of thousands
+    of QTableWidgetItems.
+    """
+
+    PAGE_SIZE = 200
+
+    def __init__(self, columns: list[tuple], parent=None) -> None:
+        """columns: (header, row key, format string or None[, text for NULL]) per column."""
+        super().__init__(parent)
+        self._columns = columns
+        self._rows: list = []
+        self._source = iter(())
+        self._exhausted = True
+        # set_pages(): ordered ids, the page loader, next id offset, request in flight
+        self._ids: Optional[list] = None
+        self._load_page = None
+        self._next = 0
+        self._loading = False
+        self._generation = 0
+
+    def set_source(self, rows) -> None:
+        """Replace the contents with a new row iterator (cursor, list, ...)."""
+        self.beginResetModel()
+        old = self._source
+        if hasattr(old, "close"):
+            old.close()  # finalize an abandoned cursor
+        self._rows = []
+        self._source = iter(rows)
+        self._ids = None
+        self._loading = False
+        self._generation += 1
+        self._exhausted = False
+        self.endResetModel()
+        # First page now, so rowCount() is meaningful before the view asks
+        self.fetchMore(QModelIndex())
+
+    def set_pages(self, ids: list, load_page, first_rows: Optional[list] = None) -> None:
+        """Replace the contents with the result ``ids`` (in display order), loaded page by page.
+
+        load_page(page_ids, on_rows) must fetch the rows of page_ids (on a
+        worker, or inline) and call on_rows(rows), or on_rows(None) on failure.
+        ``first_rows``, if given, are already-loaded rows for the first page.
+        """
+        self.beginResetModel()
+        self._source = iter(())
+        self._rows = list(first_rows or [])
+        self._ids = list(ids)
+        self._load_page = load_page
+        self._next = len(self._rows) if first_rows is not None else 0
+        self._loading = False
+        self._generation += 1
+        self._exhausted = self._next >= len(self._ids)
+        self.endResetModel()
+        if first_rows is None:
+            self.fetchMore(QModelIndex())
+
+    def _on_page(self, generation: int, page_end: int, rows) -> None:
+        if generation != self._generation:
+            return  # a newer result replaced the one this page belongs to
+        self._loading = False
+        if rows is None:
+            return  # failed; the next scroll asks again
+        self._next = page_end
+        self._exhausted = self._next >= len(self._ids)
+        self.append_rows(rows)
+
+    def append_rows(self, rows) -> None:
+        """Add a batch of rows at the end (progressive loading from a worker)."""
+        if not rows:
+            return
+        first = len(self._rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self._rows.extend(rows)
+        self.endInsertRows()
+
+    def row(self, r: int):
+        """Underlying row for view row r."""
+        return self._rows[r]
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        column = self._columns[index.column()]
+        value = self._rows[index.row()][column[1]]
+        fmt = column[2]
+        if value is None:
+            return column[3] if len(column) > 3 else ""
+        return fmt.format(value) if fmt else str(value)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self._columns[section][0]
+        return str(section + 1)
+
+    def canFetchMore(self, parent=QModelIndex()) -> bool:
+        return not parent.isValid() and not self._exhausted and not self._loading
+
+    def fetchMore(self, parent=QModelIndex()) -> None:
+        if parent.isValid() or self._exhausted or self._loading:
+            return
+        if self._ids is not None:
+            page_end = min(self._next + self.PAGE_SIZE, len(self._ids))
+            generation = self._generation
+            self._loading = True
+            self._load_page(
+                self._ids[self._next:page_end],
+                lambda rows: self._on_page(generation, page_end, rows),
+            )
+            return
+        batch = list(itertools.islice(self._source, self.PAGE_SIZE))
+        if len(batch) < self.PAGE_SIZE:
+            self._exhausted = True
+        if batch:
+            first = len(self._rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(batch) - 1)
+            self._rows.extend(batch)
+            self.endInsertRows()
+
+
+def load_product_pages(reader: BackgroundReader, model: RowTableModel, active_only: bool,
+                       search_text: str, channel: str = "products") -> None:
+    """Search products on the reader's worker and page the result into ``model`` by id.
+
+    The search job returns the ordered ids plus the first page of rows; each
+    further page is its own worker job, so no cursor outlives its job and the
+    GUI thread never reads the database.
+    """
+    def search(ctx):
+        ids = ctx.db.search_product_ids(active_only=active_only, search_text=search_text)
+        return ids, ctx.db.get_products_by_ids(ids[:RowTableModel.PAGE_SIZE])
+
+    def load_page(page_ids, on_rows):
+        def failed(message):
+            print(f"Loading products failed: {message}", file=sys.stderr)
+            on_rows(None)
+
+        reader.submit(
+            channel + "-page", lambda ctx: ctx.db.get_products_by_ids(page_ids), on_rows, on_error=failed
+        )
+
+    reader.submit(channel, search, lambda result: model.set_pages(result[0], load_page, result[1]))
+
+
+# --------- Cart Model --------- #
+
+class CartModel:
+    """Cart lines plus running totals, updated incrementally per line change.
+
+    Uses the same line math as Database.create_invoice. Totals are kept as two
+    running sums, so adding, editing or removing a line costs O(1) no matter
+    how big the cart is:
+      base_sum    = Σ price * qty
+      taxable_sum = Σ price * qty * tax_rate / 100
+    The global discount scales both sums.
+    """
+
+    def __init__(self) -> None:
+        self.items: list[dict] = []
+        self.discount_percent = 0.0
+        self._row_by_product: dict[int, int] = {}
+        self._base_sum = 0.0
+        self._taxable_sum = 0.0
+
+    @staticmethod
+    def _line_sums(item: dict) -> tuple[float, float]:
+        base = float(item["price"]) * float(item["quantity"])
+        return base, base * (float(item["tax_rate"]) / 100.0)
+
+    def _apply_delta(self, item: dict, sign: float) -> None:
+        base, taxable = self._line_sums(item)
+        self._base_sum += sign * base
+        self._taxable_sum += sign * taxable
+
+    def _resync(self) -> None:
+        """Re-add every line in cart order, dropping float drift from +/- deltas."""
+        self._base_sum = self._taxable_sum = 0.0
+        for item in self.items:
+            self._apply_delta(item, +1.0)
+
+    @property
+    def discount_factor(self) -> float:
+        return 1.0 - (self.discount_percent / 100.0)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def row_of(self, product_id: int) -> Optional[int]:
+        return self._row_by_product.get(product_id)
+
+    def add_product(self, product_row) -> tuple[int, bool]:
+        """Add one unit of a product; return (row, is_new_row)."""
+        pid = product_row["id"]
+        row = self._row_by_product.get(pid)
+        if row is not None:
+            self.set_quantity(row, self.items[row]["quantity"] + 1)
+            return row, False
+
+        item = {
+            "product_id": pid,
+            "code": product_row["code"],
+            "name": product_row["name"],
+            "price": float(product_row["price"]),
+            "tax_rate": float(product_row["tax_rate"]),
+            "quantity": 1.0,
+        }
+        self.items.append(item)
+        self._row_by_product[pid] = len(self.items) - 1
+        self._apply_delta(item, +1.0)
+        return len(self.items) - 1, True
+
+    def set_quantity(self, row: int, quantity: float) -> None:
+        item = self.items[row]
+        self._apply_delta(item, -1.0)
+        item["quantity"] = quantity
+        self._apply_delta(item, +1.0)
+
+    def remove(self, row: int) -> None:
+        # Row indexes shift anyway, so this is already O(n): resync while at it
+        self.items.pop(row)
+        self._row_by_product = {it["product_id"]: r for r, it in enumerate(self.items)}
+        self._resync()
+
+    def clear(self) -> None:
+        self.items.clear()  # in place: BillingTab.cart_items aliases this list
+        self._row_by_product.clear()
+        self._base_sum = self._taxable_sum = 0.0
+
+    def set_discount(self, percent: float) -> None:
+        self.discount_percent = float(percent)
+        self._resync()  # every line total is redrawn on a discount change anyway
+
+    def line_total(self, row: int) -> float:
+        item = self.items[row]
+        discounted_base = float(item["price"]) * float(item["quantity"]) * self.discount_factor
+        return discounted_base + discounted_base * (float(item["tax_rate"]) / 100.0)
+
+    def totals(self) -> dict:
+        factor = self.discount_factor
+        discounted = self._base_sum * factor
+        tax_total = self._taxable_sum * factor
+        return {
+            "subtotal": self._base_sum,
+            "discount_total": self._base_sum - discounted,
+            "tax_total": tax_total,
+            "grand_total": discounted + tax_total,
+        }
+
+
+# --------- Receipt printing --------- #
+
+def format_receipt(invoice_id: int, totals: dict, customer_name: str, payment_method: str,
+                   notes: str, lines) -> str:
+    """Plain-text receipt; ``lines`` are (name, quantity, unit price, line total)."""
+    out = []
+    out.append("LUXE MARKET SUPERMARKET")
+    out.append("Premium Billing Receipt")
+    out.append("-" * 40)
+    out.append(f"Invoice #: {invoice_id}")
+    out.append(f"Date: {totals['datetime']}")
+    out.append(f"Customer: {customer_name}")
+    out.append("-" * 40)
+    out.append("{:<4} {:<14} {:>5} {:>7} {:>8}".format("#", "Item", "Qty", "Price", "Total"))
+    for idx, (name, qty, price, line_total) in enumerate(lines, start=1):
+        out.append(
+            "{:<4} {:<14} {:>5} {:>7.2f} {:>8.2f}".format(idx, str(name)[:14], qty, price, line_total)
+        )
+    out.append("-" * 40)
+    out.append(f"Subtotal:      {totals['subtotal']:>10.2f}")
+    out.append(f"Discount:      {totals['discount_total']:>10.2f}")
+    out.append(f"Tax:           {totals['tax_total']:>10.2f}")
+    out.append(f"Grand Total:   {totals['grand_total']:>10.2f}")
+    out.append(f"Paid:          {totals['paid_amount']:>10.2f}")
+    out.append(f"Change:        {totals['change_due']:>10.2f}")
+    out.append(f"Payment: {payment_method}")
+    if notes:
+        out.append(f"Notes: {notes}")
+    out.append("-" * 40)
+    out.append("Thank you for shopping with us!")
+    return "\n".join(out)
+
+
+def format_stored_receipt(invoice, items) -> str:
+    """Receipt text for a saved invoice (a row from iter_invoice_receipts)."""
+    totals = {
+        "datetime": invoice["datetime"],
+        "subtotal": invoice["subtotal"] or 0.0,
+        "discount_total": invoice["discount"] or 0.0,
+        "tax_total": invoice["tax_total"] or 0.0,
+        "grand_total": invoice["grand_total"] or 0.0,
+        "paid_amount": invoice["paid_amount"] or 0.0,
+        "change_due": invoice["change_due"] or 0.0,
+    }
+    return format_receipt(
+        invoice["id"], totals, invoice["customer_name"] or "Walk-in Customer",
+        invoice["payment_method"], invoice["notes"],
+        [(r["product_name"], r["quantity"], r["unit_price"], r["line_total"]) for r in items],
+    )
+
+
+RECEIPT_PROGRESS_EVERY = 50  # batch PDF progress updates, in receipts
+
+
+class ReceiptRenderer:
+    """Lays out receipt text and renders it to a printer or PDF.
+
+    Lives on the print worker thread. The text document (fixed-width font)
+    and one QPrinter per destination are set up on first use and reused,
+    so each receipt only pays for its own layout and paint.
+    """
+
+    def __init__(self) -> None:
+        self._doc: Optional[QTextDocument] = None
+        self._printers: dict = {}   # printer name, or None for PDF -> QPrinter
+
+    def _document(self, text: str) -> QTextDocument:
+        if self._doc is None:
+            self._doc = QTextDocument()
+            self._doc.setDefaultFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self._doc.setPlainText(text)
+        return self._doc
+
+    def _printer(self, printer_name: Optional[str]) -> QPrinter:
+        printer = self._printers.get(printer_name)
+        if printer is None:
+            printer = QPrinter(QPrinter.HighResolution)
+            printer.setPageSize(QPageSize(QPageSize.A4))
+            if printer_name is None:
+                printer.setOutputFormat(QPrinter.PdfFormat)
+            elif QPrinterInfo.printerInfo(printer_name).isNull():
+                raise ValueError(f"Printer not available: {printer_name}")
+            else:
+                printer.setPrinterName(printer_name)
+            self._printers[printer_name] = printer
+        return printer
 
+    def print_text(self, text: str, printer_name: str) -> None:
+        self._document(text).print_(self._printer(printer_name))
 
-# --- PATCH START: Auto-Restock Dialog ---
+    def save_pdf(self, text: str, file_path: str) -> None:
+        printer = self._printer(None)
+        printer.setOutputFileName(file_path)
+        self._document(text).print_(printer)
+        if not os.path.exists(file_path):
+            # print_() reports nothing; a missing file means the painter couldn't open it
+            raise OSError(f"Could not write {file_path}")
 
-class RestockDialog(QDialog):
-    """Popup dialog to restock multiple low-stock items."""
 
-    def __init__(self, db: Database, low_items: list[sqlite3.Row], parent=None):
-        super().__init__(parent)
-        self.db = db
-        self.low_items = low_items
-        self.restock_inputs = {}
+class ReceiptPrintQueue(QObject):
+    """Prints receipts and writes receipt PDFs in order on a worker thread.
 
-        self.setWindowTitle("Restock Low Inventory")
-        layout = QVBoxLayout(self)
+    Built on BackgroundReader: every job gets its own channel so none
+    replaces another, callbacks run on the GUI thread, and batch jobs read
+    stored invoices through the worker's own connection.
+    """
 
-        layout.addWidget(QLabel("The following items are low on stock:"))
-        layout.addSpacing(10)
+    def __init__(self, db, parent=None) -> None:
+        super().__init__(parent)
+        self.reader = BackgroundReader(db, self)
+        self.renderer = ReceiptRenderer()
+        self._jobs = itertools.count(1)
+
+    def _submit(self, job, on_done=None, on_progress=None, on_error=None) -> int:
+        return self.reader.submit(
+            f"receipt-{next(self._jobs)}", job, on_done or (lambda _result: None),
+            on_batch=on_progress, on_error=on_error,
+        )
 
-        grid = QGridLayout()
-        grid.addWidget(QLabel("<b>Product</b>"), 0, 0)
-        grid.addWidget(QLabel("<b>Current</b>"), 0, 1)
-        grid.addWidget(QLabel("<b>Add</b>"), 0, 2)
+    def print_receipt(self, text: str, printer_name: str, on_done=None, on_error=None) -> int:
+        return self._submit(lambda ctx: self.renderer.print_text(text, printer_name), on_done, on_error=on_error)
 
-        for i, item in enumerate(low_items, start=1):
-            name_lbl = QLabel(item["name"])
-            stock_lbl = QLabel(f"{item['stock']:.2f}")
-            spin = QSpinBox()
-            spin.setRange(0, 10_000)
-            spin.setValue(0)
-            grid.addWidget(name_lbl, i, 0)
-            grid.addWidget(stock_lbl, i, 1)
-            grid.addWidget(spin, i, 2)
-            self.restock_inputs[item["id"]] = spin
+    def save_pdf(self, text: str, file_path: str, on_done=None, on_error=None) -> int:
+        return self._submit(lambda ctx: self.renderer.save_pdf(text, file_path), on_done, on_error=on_error)
 
-        layout.addLayout(grid)
-        layout.addSpacing(15)
+    def save_pdfs(self, first_id: int, last_id: int, out_dir: str,
+                  on_done=None, on_progress=None, on_error=None) -> int:
+        """Write Invoice_<id>.pdf for every stored invoice in the id range.
 
-        btn_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
-        btn_box.accepted.connect(self.accept)
-        btn_box.rejected.connect(self.reject)
-        layout.addWidget(btn_box)
+        on_progress gets the running count; on_done the final one. Cancel
+        with cancel(ticket) to stop after the current receipt.
+        """
+        def job(ctx):
+            written = 0
+            for invoice, items in ctx.db.iter_invoice_receipts(first_id, last_id):
+                if ctx.cancelled():
+                    break
+                path = os.path.join(out_dir, f"Invoice_{invoice['id']}.pdf")
+                self.renderer.save_pdf(format_stored_receipt(invoice, items), path)
+                written += 1
+                if written % RECEIPT_PROGRESS_EVERY == 0:
+                    ctx.emit_batch(written)
+            return written
 
-        self.resize(450, 300)
+        return self._submit(job, on_done, on_progress, on_error)
 
-    def get_restock_data(self):
-        """Return dict {product_id: quantity_to_add}."""
-        return {pid: spin.value() for pid, spin in self.restock_inputs.items() if spin.value() > 0}
+    def cancel(self, ticket: int) -> None:
+        self.reader.cancel(ticket)
 
-# --- PATCH END ---
 
 # --------- Billing Tab --------- #
 
 class BillingTab(QWidget):
-    def __init__(self, db: Database, parent=None) -> None:
+    def __init__(self, db: Database, parent=None, write_queue: Optional[InvoiceWriteQueue] = None) -> None:
         super().__init__(parent)
         self.db = db
-        self.cart_items: list[dict] = []
+        self.write_queue = write_queue  # write-behind checkouts (--journal), else synchronous
+        self.print_queue = ReceiptPrintQueue(db, self)
+        self._receipt_dialog: Optional[QDialog] = None
+        self.cart = CartModel()
+        self.cart_items: list[dict] = self.cart.items
         self.suppress_cart_signals = False
         self.sound = SoundManager()  # ✅ New: sound feedback
 
+        # Product search runs debounced on a worker thread with its own connection
+        self.reader = BackgroundReader(db, self)
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self._search_timer.timeout.connect(self.load_products)
+
         self.init_ui()
         self.load_products()
         self.load_customers()
@@ -781,6 +3205,19 @@ class BillingTab(QWidget):
         )
         self.layout().insertWidget(0, self.status_banner)
 
+        # Write-behind health: warn while sales sit in the journal without reaching the database
+        self.journal_label = QLabel("")
+        self.journal_label.setAlignment(Qt.AlignCenter)
+        self.journal_label.setStyleSheet(
+            "QLabel { background-color: #ffcccc; color: #222; padding: 6px; border-radius: 8px; font-weight: 600; }"
+        )
+        self.journal_label.hide()
+        self.layout().insertWidget(1, self.journal_label)
+        if self.write_queue is not None:
+            self._journal_timer = QTimer(self)
+            self._journal_timer.timeout.connect(self._update_journal_status)
+            self._journal_timer.start(JOURNAL_STATUS_INTERVAL_MS)
+
 
         # --- NEW: barcode scan buffer ---
         self._scan_buffer = ""
@@ -805,17 +3242,26 @@ class BillingTab(QWidget):
         search_layout = QHBoxLayout()
         self.product_search_edit = QLineEdit()
         self.product_search_edit.setPlaceholderText("Search products by code, name, category...")
-        self.product_search_edit.textChanged.connect(self.load_products)
+        self.product_search_edit.textChanged.connect(self._search_timer.start)
         search_layout.addWidget(QLabel("Search:"))
         search_layout.addWidget(self.product_search_edit)
 
-        self.product_table = QTableWidget(0, 6)
-        self.product_table.setHorizontalHeaderLabels(
-            ["Code", "Name", "Category", "Price", "Tax%", "Stock"]
+        self.product_model = RowTableModel(
+            [
+                ("Code", "code", None),
+                ("Name", "name", None),
+                ("Category", "category", None),
+                ("Price", "price", "{:.2f}"),
+                ("Tax%", "tax_rate", "{:.2f}"),
+                ("Stock", "stock", "{:.2f}"),
+            ],
+            self,
         )
+        self.product_table = QTableView()
+        self.product_table.setModel(self.product_model)
         self.product_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        self.product_table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.product_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.product_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.product_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.product_table.doubleClicked.connect(self.add_selected_product_to_cart)
 
         add_layout = QHBoxLayout()
@@ -883,7 +3329,7 @@ class BillingTab(QWidget):
         self.paid_amount_spin = QDoubleSpinBox()
         self.paid_amount_spin.setRange(0, 10_000_000)
         self.paid_amount_spin.setDecimals(2)
-        self.paid_amount_spin.valueChanged.connect(self.recalculate_totals)
+        self.paid_amount_spin.valueChanged.connect(self._update_totals_labels)
 
         self.notes_edit = QLineEdit()
         self.notes_edit.setPlaceholderText("Optional notes (invoice remark)")
@@ -934,16 +3380,9 @@ class BillingTab(QWidget):
     # ----- Loading data ----- #
 
     def load_products(self) -> None:
+        self._search_timer.stop()
         search_text = self.product_search_edit.text().strip()
-        rows = self.db.get_products(active_only=True, search_text=search_text)
-        self.product_table.setRowCount(len(rows))
-        for r, row in enumerate(rows):
-            self.product_table.setItem(r, 0, QTableWidgetItem(row["code"]))
-            self.product_table.setItem(r, 1, QTableWidgetItem(row["name"]))
-            self.product_table.setItem(r, 2, QTableWidgetItem(row["category"] or ""))
-            self.product_table.setItem(r, 3, QTableWidgetItem(f"{row['price']:.2f}"))
-            self.product_table.setItem(r, 4, QTableWidgetItem(f"{row['tax_rate']:.2f}"))
-            self.product_table.setItem(r, 5, QTableWidgetItem(f"{row['stock']:.2f}"))
+        load_product_pages(self.reader, self.product_model, True, search_text)
 
     def load_customers(self) -> None:
         rows = self.db.get_customers(active_only=True)
@@ -955,10 +3394,10 @@ class BillingTab(QWidget):
     # ----- Cart management ----- #
 
     def add_selected_product_to_cart(self) -> None:
-        row = self.product_table.currentRow()
+        row = self.product_table.currentIndex().row()
         if row < 0:
             return
-        code = self.product_table.item(row, 0).text()
+        code = self.product_model.row(row)["code"]
         product = self.db.get_product_by_code(code)
         if not product:
             show_error(self, "Product no longer available.")
@@ -979,21 +3418,31 @@ class BillingTab(QWidget):
 
 
     def refresh_cart_table(self) -> None:
+        """Rebuild every cart row (new bill / full reload only)."""
         self.suppress_cart_signals = True
         self.cart_table.setRowCount(len(self.cart_items))
-        for r, item in enumerate(self.cart_items):
-            self.cart_table.setItem(r, 0, QTableWidgetItem(item["code"]))
-            self.cart_table.setItem(r, 1, QTableWidgetItem(item["name"]))
+        for r in range(len(self.cart_items)):
+            self._fill_cart_row(r)
+        self.suppress_cart_signals = False
+
+    def _fill_cart_row(self, r: int) -> None:
+        item = self.cart_items[r]
+        self.cart_table.setItem(r, 0, QTableWidgetItem(item["code"]))
+        self.cart_table.setItem(r, 1, QTableWidgetItem(item["name"]))
 
-            qty_item = QTableWidgetItem(str(item["quantity"]))
-            qty_item.setFlags(qty_item.flags() | Qt.ItemFlag.ItemIsEditable)
-            self.cart_table.setItem(r, 2, qty_item)
+        qty_item = QTableWidgetItem(str(item["quantity"]))
+        qty_item.setFlags(qty_item.flags() | Qt.ItemFlag.ItemIsEditable)
+        self.cart_table.setItem(r, 2, qty_item)
 
-            self.cart_table.setItem(r, 3, QTableWidgetItem(f"{item['price']:.2f}"))
-            self.cart_table.setItem(r, 4, QTableWidgetItem(f"{item['tax_rate']:.2f}"))
+        self.cart_table.setItem(r, 3, QTableWidgetItem(f"{item['price']:.2f}"))
+        self.cart_table.setItem(r, 4, QTableWidgetItem(f"{item['tax_rate']:.2f}"))
+        self.cart_table.setItem(r, 5, QTableWidgetItem(f"{self.cart.line_total(r):.2f}"))
 
-            # Line total computed in recalculate_totals; show placeholder first
-            self.cart_table.setItem(r, 5, QTableWidgetItem("0.00"))
+    def _update_cart_row(self, r: int) -> None:
+        """Refresh only the quantity and line total cells of one row."""
+        self.suppress_cart_signals = True
+        self.cart_table.item(r, 2).setText(str(self.cart_items[r]["quantity"]))
+        self.cart_table.item(r, 5).setText(f"{self.cart.line_total(r):.2f}")
         self.suppress_cart_signals = False
 
     def on_cart_item_changed(self, item: QTableWidgetItem) -> None:
@@ -1015,19 +3464,20 @@ class BillingTab(QWidget):
                 self.cart_table.blockSignals(False)
                 return
 
-            self.cart_items[row]["quantity"] = qty
-            self.recalculate_totals()
+            self.cart.set_quantity(row, qty)
+            self._update_cart_row(row)
+            self._update_totals_labels()
 
     def remove_selected_cart_item(self) -> None:
         row = self.cart_table.currentRow()
         if row < 0:
             return
-        del self.cart_items[row]
-        self.refresh_cart_table()
-        self.recalculate_totals()
+        self.cart.remove(row)
+        self.cart_table.removeRow(row)
+        self._update_totals_labels()
 
     def new_bill(self) -> None:
-        self.cart_items.clear()
+        self.cart.clear()
         self.refresh_cart_table()
         self.global_discount_spin.setValue(0.0)
         self.paid_amount_spin.setValue(0.0)
@@ -1035,43 +3485,25 @@ class BillingTab(QWidget):
         self.recalculate_totals()
 
     def recalculate_totals(self) -> None:
-        discount_percent = self.global_discount_spin.value()
-        discount_factor = 1.0 - (discount_percent / 100.0)
-        subtotal = 0.0
-        discount_total = 0.0
-        tax_total = 0.0
-        grand_total = 0.0
-
-        for idx, item in enumerate(self.cart_items):
-            price = float(item["price"])
-            qty = float(item["quantity"])
-            tax_rate = float(item["tax_rate"])
-            base = price * qty
-            discounted_base = base * discount_factor
-            line_discount = base - discounted_base
-            tax = discounted_base * (tax_rate / 100.0)
-            line_total = discounted_base + tax
-
-            subtotal += base
-            discount_total += line_discount
-            tax_total += tax
-            grand_total += line_total
-
-            # Update line total in table
-            if idx < self.cart_table.rowCount():
-                self.suppress_cart_signals = True
-                self.cart_table.setItem(
-                    idx, 5, QTableWidgetItem(f"{line_total:.2f}")
-                )
-                self.suppress_cart_signals = False
+        """Apply the global discount to every line (it changes all line totals)."""
+        self.cart.set_discount(self.global_discount_spin.value())
+        self.suppress_cart_signals = True
+        for idx in range(min(len(self.cart_items), self.cart_table.rowCount())):
+            cell = self.cart_table.item(idx, 5)
+            if cell is not None:
+                cell.setText(f"{self.cart.line_total(idx):.2f}")
+        self.suppress_cart_signals = False
+        self._update_totals_labels()
 
+    def _update_totals_labels(self) -> None:
+        totals = self.cart.totals()
         paid_amount = self.paid_amount_spin.value()
-        change = max(0.0, paid_amount - grand_total)
+        change = max(0.0, paid_amount - totals["grand_total"])
 
-        self.subtotal_label.setText(f"{subtotal:.2f}")
-        self.discount_label.setText(f"{discount_total:.2f}")
-        self.tax_label.setText(f"{tax_total:.2f}")
-        self.total_label.setText(f"{grand_total:.2f}")
+        self.subtotal_label.setText(f"{totals['subtotal']:.2f}")
+        self.discount_label.setText(f"{totals['discount_total']:.2f}")
+        self.tax_label.setText(f"{totals['tax_total']:.2f}")
+        self.total_label.setText(f"{totals['grand_total']:.2f}")
         self.change_label.setText(f"{change:.2f}")
     def save_and_print_invoice(self) -> None:
         if not self.cart_items:
@@ -1090,15 +3522,19 @@ class BillingTab(QWidget):
         notes = self.notes_edit.text().strip()
         discount_percent = float(self.global_discount_spin.value())
 
+        checkout = dict(
+            customer_id=customer_id,
+            cart_items=self.cart_items,
+            global_discount_percent=discount_percent,
+            payment_method=payment_method,
+            paid_amount=paid_amount,
+            notes=notes,
+        )
         try:
-            invoice_id, totals = self.db.create_invoice(
-                customer_id=customer_id,
-                cart_items=self.cart_items,
-                global_discount_percent=discount_percent,
-                payment_method=payment_method,
-                paid_amount=paid_amount,
-                notes=notes,
-            )
+            if self.write_queue is not None:
+                invoice_id, totals = self.write_queue.create_invoice(self.db, **checkout)
+            else:
+                invoice_id, totals = self.db.create_invoice(**checkout)
         except ValueError as e:
             self.sound.play_error()
             show_error(self, str(e))
@@ -1108,12 +3544,20 @@ class BillingTab(QWidget):
 
         receipt_text = self.build_receipt_text(invoice_id, totals, customer_id, payment_method, notes)
 
-        # Use QTextDocument for print/PDF rendering
-        doc = QTextDocument()
-        doc.setPlainText(receipt_text)
-
         try:
+            # Non-modal and not focused: the next scan goes straight to the till
+            # while this receipt prints or waits. One preview open at a time.
+            if self._receipt_dialog is not None:
+                self._receipt_dialog.close()
             dlg = QDialog(self)
+            dlg.setAttribute(Qt.WA_DeleteOnClose)
+            dlg.setAttribute(Qt.WA_ShowWithoutActivating)
+            # Only forget the dialog if it is still the current one: the previous
+            # preview's deferred delete arrives after this one is assigned
+            dlg.destroyed.connect(
+                lambda _=None, d=dlg: self._receipt_dialog is d and setattr(self, "_receipt_dialog", None)
+            )
+            self._receipt_dialog = dlg
             dlg.setWindowTitle(f"Invoice #{invoice_id} - Preview / Print")
             layout = QVBoxLayout(dlg)
 
@@ -1124,23 +3568,27 @@ class BillingTab(QWidget):
 
             button_layout = QHBoxLayout()
             btn_print = QPushButton("Print")
-            btn_print.clicked.connect(lambda: self._print_invoice(text_edit))
+            btn_print.clicked.connect(lambda: self._print_invoice(receipt_text, invoice_id))
 
             btn_pdf = QPushButton("Save as PDF")
             btn_pdf.clicked.connect(lambda: self._save_pdf(receipt_text, invoice_id))
 
+            btn_printer = QPushButton("Printer…")
+            btn_printer.clicked.connect(self._choose_printer)
+
             btn_close = QPushButton("Close")
-            btn_close.clicked.connect(dlg.accept)
+            btn_close.clicked.connect(dlg.close)
 
             button_layout.addWidget(btn_print)
             button_layout.addWidget(btn_pdf)
+            button_layout.addWidget(btn_printer)
             button_layout.addStretch()
             button_layout.addWidget(btn_close)
 
             layout.addLayout(button_layout)
 
             dlg.resize(600, 700)
-            dlg.exec()
+            dlg.show()
 
 
         except Exception as e:
@@ -1151,12 +3599,7 @@ class BillingTab(QWidget):
 
 
         # --- Auto-Restock Prompt ---
-        low_items = []
-        for item in self.cart_items:
-            product = self.db.get_product_by_code(item["code"])
-            if product["stock"] <= product["restock_level"]:
-
-                low_items.append(product)
+        low_items = self._reorder_suggestions([item["product_id"] for item in self.cart_items])
 
         if low_items:
             self.sound.play_warning()
@@ -1174,19 +3617,18 @@ class BillingTab(QWidget):
                     self._show_status_banner("ℹ️ No changes made.", "gray")
 
         # --- Low stock check after billing ---
-        low_items = []
-        for item in self.cart_items:
-            product = self.db.get_product_by_code(item["code"])
-            if not product:
-                continue
-            stock_left = product["stock"]
-            if stock_left <= LOW_STOCK_THRESHOLD:
-                low_items.append((product["name"], stock_left))
+        low_items = [
+            (row["name"], row["stock"], row["days_of_cover"])
+            for row in self._reorder_suggestions([item["product_id"] for item in self.cart_items])
+        ]
 
         if low_items:
             msg_lines = [
                 f"⚠️ LOW STOCK ALERT ({len(low_items)} items):",
-                *(f"• {n} ({s} left)" for n, s in low_items),
+                *(
+                    f"• {n} ({s} left" + ("" if d is None else f", ~{d:.1f} days") + ")"
+                    for n, s, d in low_items
+                ),
             ]
             self.sound.play_warning()
             show_info(self, "\n".join(msg_lines))
@@ -1196,15 +3638,56 @@ class BillingTab(QWidget):
             self.load_products()
             # --- PATCH END ---
 
-    def _print_invoice(self, doc: QTextDocument):
+    def _update_journal_status(self) -> None:
+        status = self.write_queue.status()
+        if not status["alive"]:
+            text = f"⛔ Invoice writer stopped: {status['backlog']} sale(s) only in the journal. Restart the till."
+        elif status["error"]:
+            text = f"⚠️ {status['backlog']} sale(s) waiting for the database: {status['error']}"
+        elif status["backlog"] >= JOURNAL_BACKLOG_WARNING:
+            text = f"⚠️ {status['backlog']} sale(s) waiting for the database"
+        else:
+            self.journal_label.hide()
+            return
+        self.journal_label.setText(text)
+        self.journal_label.show()
+
+    def _reorder_suggestions(self, product_ids: list) -> list:
+        if self.write_queue is not None:
+            # The sale may still be queued; count it without waiting for the commit
+            return self.write_queue.get_reorder_suggestions(self.db, product_ids)
+        return self.db.get_reorder_suggestions(product_ids)
+
+    @staticmethod
+    def _local_settings() -> QSettings:
+        # Per-machine settings: the database (and its settings table) may be shared by every till
+        return QSettings("SupermarketPOS", "Till")
+
+    def _choose_printer(self) -> Optional[str]:
+        """Pick this till's receipt printer once; later prints go straight to the queue."""
         printer = QPrinter(QPrinter.HighResolution)
         printer.setPageSize(QPageSize(QPageSize.A4))
+        current = self._local_settings().value("receipt_printer")
+        if current:
+            printer.setPrinterName(current)
         dlg = QPrintDialog(printer, self)
-        if dlg.exec() == QPrintDialog.Accepted:
-            doc.print(printer)
-            show_info(self, "Invoice sent to printer.")
+        if dlg.exec() != QPrintDialog.Accepted:
+            return None
+        self._local_settings().setValue("receipt_printer", printer.printerName())
+        return printer.printerName()
+
+    def _print_invoice(self, receipt_text: str, invoice_id: int):
+        printer_name = self._local_settings().value("receipt_printer") or self._choose_printer()
+        if not printer_name:
+            return
+        self._show_status_banner(f"🖨️ Printing invoice #{invoice_id}…", "gray")
+        self.print_queue.print_receipt(
+            receipt_text, printer_name,
+            on_done=lambda _r: self._show_status_banner(f"🖨️ Invoice #{invoice_id} sent to printer.", "green"),
+            on_error=lambda message: show_error(self, f"Printing invoice #{invoice_id} failed:\n{message}"),
+        )
 
-    def _save_pdf(self, doc: QTextDocument, invoice_id: int):
+    def _save_pdf(self, receipt_text: str, invoice_id: int):
         file_path, _ = QFileDialog.getSaveFileName(
             self,
             "Save Invoice as PDF",
@@ -1214,11 +3697,11 @@ class BillingTab(QWidget):
         if not file_path:
             return
 
-        printer = QPrinter(QPrinter.HighResolution)
-        printer.setOutputFormat(QPrinter.PdfFormat)
-        printer.setOutputFileName(file_path)
-        doc.print(printer)
-        show_info(self, f"Invoice saved to: {file_path}")
+        self.print_queue.save_pdf(
+            receipt_text, file_path,
+            on_done=lambda _r: self._show_status_banner(f"📄 Invoice saved to: {file_path}", "green"),
+            on_error=lambda message: show_error(self, f"Saving {file_path} failed:\n{message}"),
+        )
 
 
     def build_receipt_text(
@@ -1232,59 +3715,20 @@ class BillingTab(QWidget):
 
         customer_name = "Walk-in Customer"
         if customer_id:
-            customers = self.db.get_customers(active_only=False)
-            for c in customers:
-                if c["id"] == customer_id:
-                    customer_name = c["name"]
-                    break
+            # The customer was picked from the combo, so its label is the name
+            index = self.customer_combo.findData(customer_id)
+            if index >= 0:
+                customer_name = self.customer_combo.itemText(index)
 
+        discount_factor = 1.0 - (float(self.global_discount_spin.value()) / 100.0)
         lines = []
-        lines.append("LUXE MARKET SUPERMARKET")
-        lines.append("Premium Billing Receipt")
-        lines.append("-" * 40)
-        lines.append(f"Invoice #: {invoice_id}")
-        lines.append(f"Date: {totals['datetime']}")
-        lines.append(f"Customer: {customer_name}")
-        lines.append("-" * 40)
-        lines.append("{:<4} {:<14} {:>5} {:>7} {:>8}".format("#", "Item", "Qty", "Price", "Total"))
-
-        discount_percent = float(self.global_discount_spin.value())
-        discount_factor = 1.0 - (discount_percent / 100.0)
-
-        for idx, item in enumerate(self.cart_items, start=1):
-            try:
-                name = str(item.get("name", ""))[:14]
-                qty = float(item.get("quantity", 0))
-                price = float(item.get("price", 0))
-                tax_rate = float(item.get("tax_rate", 0))
-
-                base = price * qty
-                discounted_base = base * discount_factor
-                tax = discounted_base * (tax_rate / 100.0)
-                line_total = discounted_base + tax
-
-                lines.append(
-                    "{:<4} {:<14} {:>5} {:>7.2f} {:>8.2f}".format(
-                        idx, name, qty, price, line_total
-                    )
-                )
-            except Exception as e:
-                lines.append(f"Error in item #{idx}: {e}")
-
-
-        lines.append("-" * 40)
-        lines.append(f"Subtotal:      {totals['subtotal']:>10.2f}")
-        lines.append(f"Discount:      {totals['discount_total']:>10.2f}")
-        lines.append(f"Tax:           {totals['tax_total']:>10.2f}")
-        lines.append(f"Grand Total:   {totals['grand_total']:>10.2f}")
-        lines.append(f"Paid:          {totals['paid_amount']:>10.2f}")
-        lines.append(f"Change:        {totals['change_due']:>10.2f}")
-        lines.append(f"Payment: {payment_method}")
-        if notes:
-            lines.append(f"Notes: {notes}")
-        lines.append("-" * 40)
-        lines.append("Thank you for shopping with us!")
-        return "\n".join(lines)
+        for item in self.cart_items:
+            qty = float(item.get("quantity", 0))
+            price = float(item.get("price", 0))
+            tax_rate = float(item.get("tax_rate", 0))
+            discounted_base = price * qty * discount_factor
+            lines.append((item.get("name", ""), qty, price, discounted_base * (1.0 + tax_rate / 100.0)))
+        return format_receipt(invoice_id, totals, customer_name, payment_method, notes, lines)
 
     def _init_shortcuts(self):
         """Keyboard shortcuts for power users."""
@@ -1366,16 +3810,12 @@ class BillingTab(QWidget):
         )
 
     def _apply_restock(self, restock_data: dict[int, int]) -> None:
-        cur = self.db.conn.cursor()
-        for pid, qty in restock_data.items():
-            cur.execute("UPDATE products SET stock = stock + ? WHERE id = ?;", (qty, pid))
-        self.db.conn.commit()
+        self.db.restock_products(restock_data)
         self.load_products()
 
 # --------- Products Tab --------- #
 
     def add_product_to_cart(self, product_row: sqlite3.Row) -> None:
-        pid = product_row["id"]
         restock_level = float(product_row["restock_level"]) if "restock_level" in product_row.keys() else 5.0
         stock_left = float(product_row["stock"])
         restock_level = float(product_row["restock_level"]) if "restock_level" in product_row.keys() else 5.0
@@ -1390,23 +3830,15 @@ class BillingTab(QWidget):
             self.sound.play_warning()
             self._show_status_banner(f"⚠️ Low stock for '{name}' ({stock_left} left)", "orange")
 
-        for item in self.cart_items:
-            if item["product_id"] == pid:
-                item["quantity"] += 1
-                break
+        row, is_new = self.cart.add_product(product_row)
+        if is_new:
+            self.suppress_cart_signals = True
+            self.cart_table.insertRow(row)
+            self._fill_cart_row(row)
+            self.suppress_cart_signals = False
         else:
-            self.cart_items.append(
-                {
-                    "product_id": pid,
-                    "code": product_row["code"],
-                    "name": product_row["name"],
-                    "price": float(product_row["price"]),
-                    "tax_rate": float(product_row["tax_rate"]),
-                    "quantity": 1.0,
-                }
-            )
-        self.refresh_cart_table()
-        self.recalculate_totals()
+            self._update_cart_row(row)
+        self._update_totals_labels()
 
         # --------- Products Tab --------- #
 
@@ -1415,6 +3847,11 @@ class ProductsTab(QWidget):
         super().__init__(parent)
         self.db = db
         self.current_product_id: Optional[int] = None
+        self.reader = BackgroundReader(db, self)
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self._search_timer.timeout.connect(self.load_products)
         self.init_ui()
         self.load_products()
 
@@ -1426,20 +3863,31 @@ class ProductsTab(QWidget):
         search_layout = QHBoxLayout()
         self.search_edit = QLineEdit()
         self.search_edit.setPlaceholderText("Search products...")
-        self.search_edit.textChanged.connect(self.load_products)
+        self.search_edit.textChanged.connect(self._search_timer.start)
         refresh_btn = QPushButton("Refresh")
         refresh_btn.clicked.connect(self.load_products)
         search_layout.addWidget(QLabel("Search:"))
         search_layout.addWidget(self.search_edit)
         search_layout.addWidget(refresh_btn)
 
-        self.table = QTableWidget(0, 8)
-        self.table.setHorizontalHeaderLabels(
-            ["ID", "Code", "Name", "Category", "Price", "Tax%", "Stock", "Restock @"]
+        self.model = RowTableModel(
+            [
+                ("ID", "id", None),
+                ("Code", "code", None),
+                ("Name", "name", None),
+                ("Category", "category", None),
+                ("Price", "price", "{:.2f}"),
+                ("Tax%", "tax_rate", "{:.2f}"),
+                ("Stock", "stock", "{:.2f}"),
+                ("Restock @", "restock_level", "{:.2f}"),
+            ],
+            self,
         )
+        self.table = QTableView()
+        self.table.setModel(self.model)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        self.table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.table.doubleClicked.connect(self.on_row_double_clicked)
 
         left_layout.addLayout(search_layout)
@@ -1493,37 +3941,24 @@ class ProductsTab(QWidget):
     # ---------- DB actions ---------- #
 
     def load_products(self) -> None:
+        self._search_timer.stop()
         search_text = self.search_edit.text().strip()
-        rows = self.db.get_products(active_only=False, search_text=search_text)
-        self.table.setRowCount(len(rows))
-        for r, row in enumerate(rows):
-            self.table.setItem(r, 0, QTableWidgetItem(str(row["id"])))
-            self.table.setItem(r, 1, QTableWidgetItem(row["code"]))
-            self.table.setItem(r, 2, QTableWidgetItem(row["name"]))
-            self.table.setItem(r, 3, QTableWidgetItem(row["category"] or ""))
-            self.table.setItem(r, 4, QTableWidgetItem(f"{row['price']:.2f}"))
-            self.table.setItem(r, 5, QTableWidgetItem(f"{row['tax_rate']:.2f}"))
-            self.table.setItem(r, 6, QTableWidgetItem(f"{row['stock']:.2f}"))
-            self.table.setItem(r, 7, QTableWidgetItem(f"{row['restock_level']:.2f}"))
+        load_product_pages(self.reader, self.model, False, search_text)
 
     def on_row_double_clicked(self) -> None:
-        row = self.table.currentRow()
+        row = self.table.currentIndex().row()
         if row < 0:
             return
-        self.current_product_id = int(self.table.item(row, 0).text())
-        self.code_edit.setText(self.table.item(row, 1).text())
-        self.name_edit.setText(self.table.item(row, 2).text())
-        self.category_edit.setText(self.table.item(row, 3).text())
-        self.price_spin.setValue(float(self.table.item(row, 4).text()))
-        self.tax_spin.setValue(float(self.table.item(row, 5).text()))
-        self.stock_spin.setValue(float(self.table.item(row, 6).text()))
-        self.restock_spin.setValue(float(self.table.item(row, 7).text()))
-        # Load active flag from DB
-        products = self.db.get_products(active_only=False)
-        for p in products:
-            if p["id"] == self.current_product_id:
-                self.active_check.setChecked(bool(p["active"]))
-                break
+        product = self.model.row(row)
+        self.current_product_id = int(product["id"])
+        self.code_edit.setText(product["code"])
+        self.name_edit.setText(product["name"])
+        self.category_edit.setText(product["category"] or "")
+        self.price_spin.setValue(float(product["price"]))
+        self.tax_spin.setValue(float(product["tax_rate"]))
+        self.stock_spin.setValue(float(product["stock"]))
+        self.restock_spin.setValue(float(product["restock_level"]))
+        self.active_check.setChecked(bool(product["active"]))
 
     def new_product(self) -> None:
         self.current_product_id = None
@@ -1711,12 +4146,157 @@ class CustomersTab(QWidget):
         self.new_customer()
 
 
+# --------- Sales Export --------- #
+
+def export_sales(db: Database, file_path: str, start: Optional[date] = None,
+                 end: Optional[date] = None, lines: bool = False,
+                 chunk_rows: int = EXPORT_CHUNK_ROWS) -> int:
+    """Stream invoices (or invoice lines) to CSV or XLSX; return the row count.
+
+    Rows are pulled from the database chunk by chunk and written straight out,
+    so memory stays flat however much history the database holds.
+    """
+    chunks = db.iter_sales_export(start, end, lines, chunk_rows)
+    headers = db.EXPORT_LINE_COLUMNS if lines else db.EXPORT_INVOICE_COLUMNS
+    count = 0
+
+    if file_path.lower().endswith(".xlsx"):
+        from openpyxl import Workbook
+
+        # write_only sheets are flushed row by row instead of kept as cells
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Sales")
+        ws.append(headers)
+        for rows in chunks:
+            for row in rows:
+                ws.append(tuple(row))
+            count += len(rows)
+        wb.save(file_path)
+        return count
+
+    import csv
+
+    with open(file_path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        for rows in chunks:
+            writer.writerows(rows)
+            count += len(rows)
+    return count
+
+
+HISTORY_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+HISTORY_WATERMARK_FILE = "_watermark.json"
+
+
+def _history_schemas():
+    import pyarrow as pa
+
+    money = pa.float64()
+    return {
+        "invoices": pa.schema([
+            ("id", pa.int64()), ("datetime", pa.timestamp("s")), ("customer_id", pa.int64()),
+            ("subtotal", money), ("discount", money), ("tax_total", money), ("grand_total", money),
+            ("payment_method", pa.string()), ("paid_amount", money), ("change_due", money),
+            ("notes", pa.string()),
+        ]),
+        "invoice_items": pa.schema([
+            ("id", pa.int64()), ("invoice_id", pa.int64()), ("product_id", pa.int64()),
+            ("product_code", pa.string()), ("product_name", pa.string()), ("quantity", pa.float64()),
+            ("unit_price", money), ("tax_rate", pa.float64()), ("line_total", money),
+        ]),
+    }
+
+
+def export_sales_history(db: Database, out_dir: str, fmt: str = "parquet", full: bool = False,
+                         chunk_rows: int = EXPORT_CHUNK_ROWS) -> dict:
+    """Append invoices and invoice_items to a month-partitioned columnar archive.
+
+    Layout: <out_dir>/<table>/month=YYYY-MM/part-<first invoice id>.<parquet|arrow>.
+    Only invoices after the watermark stored in the archive are written, so
+    repeated runs add new files instead of rewriting history; ``full`` ignores
+    the watermark and starts a fresh archive. Arrow IPC files can be opened
+    with ``pyarrow.memory_map`` for zero-copy reads. Returns rows written per
+    table.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    if fmt not in HISTORY_FORMATS:
+        raise ValueError(f"Unknown history format: {fmt}")
+    root = Path(out_dir)
+    watermark_path = root / HISTORY_WATERMARK_FILE
+    after_id = 0
+    if not full and watermark_path.exists():
+        mark = json.loads(watermark_path.read_text())
+        if mark.get("format", fmt) != fmt:
+            raise ValueError(f"{out_dir} holds a {mark['format']} archive; use full=True to start over")
+        after_id = int(mark["last_invoice_id"])
+    # Snapshot the upper bound so both tables cover the same invoices even
+    # while tills keep selling
+    upto_id = db.get_max_invoice_id()
+    written = {"invoices": 0, "invoice_items": 0}
+    if upto_id <= after_id:
+        return written
+    if full:
+        import shutil
+
+        for table in written:
+            shutil.rmtree(root / table, ignore_errors=True)
+
+    for table, schema in _history_schemas().items():
+        chunks = db.iter_history_rows(after_id, upto_id, lines=table == "invoice_items", chunk_rows=chunk_rows)
+        writers = {}
+        try:
+            for rows in chunks:
+                by_month = {}
+                for row in rows:
+                    by_month.setdefault(row[0], []).append(row)
+                for month, month_rows in by_month.items():
+                    columns = {
+                        name: [r[name] for r in month_rows] for name in schema.names
+                    }
+                    if "datetime" in columns:
+                        columns["datetime"] = pc.strptime(
+                            pa.array(columns["datetime"], pa.string()),
+                            format="%Y-%m-%d %H:%M:%S", unit="s",
+                        )
+                    batch = pa.RecordBatch.from_pydict(columns, schema=schema)
+                    writer = writers.get(month)
+                    if writer is None:
+                        part_dir = root / table / f"month={month}"
+                        part_dir.mkdir(parents=True, exist_ok=True)
+                        path = str(part_dir / f"part-{after_id + 1:010d}{HISTORY_FORMATS[fmt]}")
+                        if fmt == "parquet":
+                            writer = pq.ParquetWriter(path, schema, compression="zstd")
+                        else:
+                            writer = pa.ipc.new_file(path, schema)
+                        writers[month] = writer
+                    # One row group / record batch per chunk keeps memory flat
+                    writer.write_batch(batch)
+                    written[table] += len(month_rows)
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+    # Advance the watermark only once every file is complete
+    tmp_path = watermark_path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps({"last_invoice_id": upto_id, "format": fmt}))
+    os.replace(tmp_path, watermark_path)
+    return written
+
+
 # --------- Reports Tab --------- #
 
 class ReportsTab(QWidget):
     def __init__(self, db: Database, parent=None) -> None:
         super().__init__(parent)
         self.db = db
+        self.reader = BackgroundReader(db, self)
+        self.print_queue = ReceiptPrintQueue(db, self)
+        self._report_ticket = None
+        self._pdf_ticket = None
         self.init_ui()
 
     def init_ui(self) -> None:
@@ -1734,7 +4314,12 @@ class ReportsTab(QWidget):
 
         self.load_btn = QPushButton("Load")
         self.load_btn.clicked.connect(self.load_reports)
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.clicked.connect(self.cancel_report)
         # --- PATCH START: Export / Email / Cloud Buttons ---
+        self.export_level_combo = QComboBox()
+        self.export_level_combo.addItems(["Invoices", "Invoice lines"])
         self.export_btn = QPushButton("💾 Export Sales Data")
         self.export_btn.clicked.connect(self.export_sales_data)
 
@@ -1744,15 +4329,20 @@ class ReportsTab(QWidget):
         self.sync_btn = QPushButton("☁️ Sync to Google Sheets")
         self.sync_btn.clicked.connect(self.sync_to_google)
         # --- PATCH END ---
+        self.receipts_btn = QPushButton("🧾 Receipt PDFs")
+        self.receipts_btn.clicked.connect(self.export_receipt_pdfs)
 
         filter_layout.addWidget(QLabel("From:"))
         filter_layout.addWidget(self.start_date_edit)
         filter_layout.addWidget(QLabel("To:"))
         filter_layout.addWidget(self.end_date_edit)
         filter_layout.addWidget(self.load_btn)
+        filter_layout.addWidget(self.cancel_btn)
+        filter_layout.addWidget(self.export_level_combo)
         filter_layout.addWidget(self.export_btn)
         filter_layout.addWidget(self.email_btn)
         filter_layout.addWidget(self.sync_btn)
+        filter_layout.addWidget(self.receipts_btn)
         filter_layout.addStretch()
 
 
@@ -1782,70 +4372,149 @@ class ReportsTab(QWidget):
         summary_layout.addWidget(QLabel("Grand:"))
         summary_layout.addWidget(self.total_grand_label)
         summary_layout.addStretch()
+        self.status_label = QLabel("")
+        summary_layout.addWidget(self.status_label)
 
         main_layout.addWidget(summary_group)
 
         # Table
-        self.table = QTableWidget(0, 8)
-        self.table.setHorizontalHeaderLabels(
+        self.model = RowTableModel(
             [
-                "ID",
-                "DateTime",
-                "Customer",
-                "Subtotal",
-                "Discount",
-                "Tax",
-                "Total",
-                "Payment",
-            ]
+                ("ID", "id", None),
+                ("DateTime", "datetime", None),
+                ("Customer", "customer_name", None, "Walk-in"),
+                ("Subtotal", "subtotal", "{:.2f}"),
+                ("Discount", "discount", "{:.2f}"),
+                ("Tax", "tax_total", "{:.2f}"),
+                ("Total", "grand_total", "{:.2f}"),
+                ("Payment", "payment_method", None),
+            ],
+            self,
         )
+        self.table = QTableView()
+        self.table.setModel(self.model)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        self.table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.table.doubleClicked.connect(self.show_invoice_detail)
 
         main_layout.addWidget(self.table)
 
     def load_reports(self) -> None:
+        """Load the range on the worker: SQL totals first, then rows in batches."""
         start_qdate = self.start_date_edit.date()
         end_qdate = self.end_date_edit.date()
         start_pydate = date(start_qdate.year(), start_qdate.month(), start_qdate.day())
         end_pydate = date(end_qdate.year(), end_qdate.month(), end_qdate.day())
 
-        rows = self.db.get_invoices_between_dates(start_pydate, end_pydate)
-        self.table.setRowCount(len(rows))
+        self.cancel_report()
+        self.model.set_source([])
+        self._set_summary(None)
+        self.status_label.setText("Loading…")
+        self.cancel_btn.setEnabled(True)
 
-        total_subtotal = 0.0
-        total_discount = 0.0
-        total_tax = 0.0
-        total_grand = 0.0
+        self.reader.submit(
+            "report-summary",
+            lambda ctx: ctx.db.get_invoice_totals_between_dates(start_pydate, end_pydate),
+            self._set_summary,
+        )
 
-        for r, row in enumerate(rows):
-            self.table.setItem(r, 0, QTableWidgetItem(str(row["id"])))
-            self.table.setItem(r, 1, QTableWidgetItem(row["datetime"]))
-            self.table.setItem(r, 2, QTableWidgetItem(row["customer_name"] or "Walk-in"))
-            self.table.setItem(r, 3, QTableWidgetItem(f"{row['subtotal']:.2f}"))
-            self.table.setItem(r, 4, QTableWidgetItem(f"{row['discount']:.2f}"))
-            self.table.setItem(r, 5, QTableWidgetItem(f"{row['tax_total']:.2f}"))
-            self.table.setItem(r, 6, QTableWidgetItem(f"{row['grand_total']:.2f}"))
-            self.table.setItem(r, 7, QTableWidgetItem(row["payment_method"]))
-
-            total_subtotal += row["subtotal"]
-            total_discount += row["discount"]
-            total_tax += row["tax_total"]
-            total_grand += row["grand_total"]
-
-        self.total_invoices_label.setText(str(len(rows)))
-        self.total_subtotal_label.setText(f"{total_subtotal:.2f}")
-        self.total_discount_label.setText(f"{total_discount:.2f}")
-        self.total_tax_label.setText(f"{total_tax:.2f}")
-        self.total_grand_label.setText(f"{total_grand:.2f}")
+        def stream_rows(ctx):
+            rows_iter = ctx.db.iter_invoices_between_dates(start_pydate, end_pydate)
+            while not ctx.cancelled():
+                rows = list(itertools.islice(rows_iter, REPORT_BATCH_ROWS))
+                if not rows:
+                    break
+                ctx.emit_batch(rows)
+            rows_iter.close()
+
+        self._report_ticket = self.reader.submit(
+            "report-rows", stream_rows, self._on_report_done,
+            on_batch=self._on_report_batch, on_error=self._on_report_error,
+        )
+
+    def export_receipt_pdfs(self) -> None:
+        """Write one PDF per invoice for an id range (defaults to the selection or loaded report)."""
+        if self._pdf_ticket is not None:
+            self.print_queue.cancel(self._pdf_ticket)
+            self._on_pdfs_done(None)
+            return
+
+        rows = [index.row() for index in self.table.selectionModel().selectedRows()]
+        ids = [self.model.row(r)["id"] for r in rows or range(self.model.rowCount())]
+        default = f"{min(ids)}-{max(ids)}" if ids else ""
+        text, ok = QInputDialog.getText(self, "Receipt PDFs", "Invoice IDs (first-last):", text=default)
+        if not ok:
+            return
+        match = re.fullmatch(r"\s*(\d+)\s*(?:-\s*(\d+))?\s*", text)
+        if not match:
+            show_error(self, "Enter an invoice ID or a range like 120-180.")
+            return
+        first_id = int(match.group(1))
+        last_id = int(match.group(2) or first_id)
+        out_dir = QFileDialog.getExistingDirectory(self, "Save receipt PDFs to")
+        if not out_dir:
+            return
+
+        self.receipts_btn.setText("Stop PDFs")
+        self.status_label.setText("Writing receipt PDFs…")
+        self._pdf_ticket = self.print_queue.save_pdfs(
+            min(first_id, last_id), max(first_id, last_id), out_dir,
+            on_done=self._on_pdfs_done,
+            on_progress=lambda written: self.status_label.setText(f"Writing receipt PDFs… {written}"),
+            on_error=self._on_pdfs_error,
+        )
+
+    def _on_pdfs_done(self, written) -> None:
+        self._pdf_ticket = None
+        self.receipts_btn.setText("🧾 Receipt PDFs")
+        self.status_label.setText("Receipt PDFs stopped" if written is None else f"Wrote {written} receipt PDFs")
+
+    def _on_pdfs_error(self, message: str) -> None:
+        self._on_pdfs_done(None)
+        show_error(self, f"Failed to write receipt PDFs:\n{message}")
+
+    def cancel_report(self) -> None:
+        if self._report_ticket is None:
+            return
+        self.reader.cancel(self._report_ticket)
+        self._report_ticket = None
+        self.cancel_btn.setEnabled(False)
+        self.status_label.setText(f"Cancelled after {self.model.rowCount()} invoices")
+
+    def _on_report_batch(self, rows) -> None:
+        self.model.append_rows(rows)
+        self.status_label.setText(f"Loading… {self.model.rowCount()} invoices")
+
+    def _on_report_done(self, _result) -> None:
+        self._report_ticket = None
+        self.cancel_btn.setEnabled(False)
+        self.status_label.setText("")
+
+    def _on_report_error(self, message: str) -> None:
+        self._report_ticket = None
+        self.cancel_btn.setEnabled(False)
+        self.status_label.setText("")
+        show_error(self, f"Failed to load report:\n{message}")
+
+    def _set_summary(self, totals) -> None:
+        if totals is None or not totals["invoice_count"]:
+            self.total_invoices_label.setText("0")
+            for label in (self.total_subtotal_label, self.total_discount_label,
+                          self.total_tax_label, self.total_grand_label):
+                label.setText("0.00")
+            return
+        self.total_invoices_label.setText(str(totals["invoice_count"]))
+        self.total_subtotal_label.setText(f"{totals['subtotal']:.2f}")
+        self.total_discount_label.setText(f"{totals['discount']:.2f}")
+        self.total_tax_label.setText(f"{totals['tax_total']:.2f}")
+        self.total_grand_label.setText(f"{totals['grand_total']:.2f}")
 
     def show_invoice_detail(self) -> None:
-        row = self.table.currentRow()
+        row = self.table.currentIndex().row()
         if row < 0:
             return
-        invoice_id = int(self.table.item(row, 0).text())
+        invoice_id = int(self.model.row(row)["id"])
         items = self.db.get_invoice_items(invoice_id)
 
         dlg = QDialog(self)
@@ -1884,33 +4553,41 @@ class ReportsTab(QWidget):
         # --- PATCH START: Export, Email, and Google Sheets ---
 
     def export_sales_data(self):
-        rows = self.db.get_all_invoices_data()
-        if not rows:
-            show_info(self, "No invoice data available.")
-            return
-
-        df = pd.DataFrame(
-            rows,
-            columns=["Invoice ID", "DateTime", "Customer", "Subtotal", "Discount", "Tax", "Total", "Payment Method"],
-        )
-
         file_path, _ = QFileDialog.getSaveFileName(
             self,
             "Export Sales Data",
             f"sales_report_{datetime.now():%Y-%m-%d}",
-            "Excel (*.xlsx);;CSV (*.csv)",
+            "CSV (*.csv);;Excel (*.xlsx)",
         )
         if not file_path:
             return
+        if not file_path.lower().endswith((".csv", ".xlsx")):
+            file_path += ".csv"
 
-        if file_path.endswith(".csv"):
-            df.to_csv(file_path, index=False, encoding="utf-8-sig")
-        else:
-            df.to_excel(file_path, index=False, engine="openpyxl")
+        start_qdate = self.start_date_edit.date()
+        end_qdate = self.end_date_edit.date()
+        start_pydate = date(start_qdate.year(), start_qdate.month(), start_qdate.day())
+        end_pydate = date(end_qdate.year(), end_qdate.month(), end_qdate.day())
+        lines = self.export_level_combo.currentIndex() == 1
 
-        show_info(self, f"✅ Sales data exported successfully to:\n{file_path}")
+        try:
+            count = export_sales(self.db, file_path, start_pydate, end_pydate, lines=lines)
+        except Exception as e:
+            show_error(self, f"❌ Export failed:\n{e}")
+            return
+        if not count:
+            show_info(self, "No invoice data in the selected period.")
+            return
+        show_info(self, f"✅ {count} rows exported successfully to:\n{file_path}")
 
     def send_email_report(self):
+        import smtplib
+        import ssl
+        from email import encoders
+        from email.mime.base import MIMEBase
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
+
         try:
             file_path, _ = QFileDialog.getOpenFileName(
                 self, "Select File to Email", "", "All Files (*)"
@@ -1947,6 +4624,10 @@ class ReportsTab(QWidget):
 
     def sync_to_google(self):
         try:
+            import gspread
+            import pandas as pd
+            from google.oauth2.service_account import Credentials
+
             creds = Credentials.from_service_account_file(
                 "google_credentials.json",
                 scopes=["https://www.googleapis.com/auth/spreadsheets"],
@@ -1971,19 +4652,118 @@ class ReportsTab(QWidget):
 
         # --------- Dashboard Tab --------- #
 
-class MplCanvas(FigureCanvasQTAgg):
-    """Qt canvas wrapper for Matplotlib figures."""
+class MplCanvas(QWidget):
+    """Qt canvas wrapper for Matplotlib figures (matplotlib loads on first use)."""
     def __init__(self, width=6, height=4, dpi=100):
+        super().__init__()
+        FigureCanvasQTAgg, Figure = _load_matplotlib()
         self.fig = Figure(figsize=(width, height), dpi=dpi)
-        super().__init__(self.fig)
+        self.canvas = FigureCanvasQTAgg(self.fig)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.canvas)
+
+    def draw(self):
+        self.canvas.draw()
+
+    def draw_idle(self):
+        self.canvas.draw_idle()
+
+    def size_key(self) -> tuple:
+        return self.canvas.width(), self.canvas.height()
+
+    def snapshot(self):
+        """Copy of the last rendered frame, for restore()."""
+        return self.canvas.copy_from_bbox(self.fig.bbox)
+
+    def restore(self, snapshot) -> None:
+        """Blit a snapshot() back instead of re-rendering the figure."""
+        self.canvas.restore_region(snapshot)
+        self.canvas.blit(self.fig.bbox)
+
+
+DASHBOARD_TICK_LABELS = 40  # most labels drawn under the stock bar chart
+DASHBOARD_AT_RISK = 30      # products in the "Most at risk" stock view
+# Days-of-cover histogram buckets: [0, 3), [3, 7), ... [60, inf), plus products without sales
+COVERAGE_EDGES = (3, 7, 14, 30, 60)
+COVERAGE_LABELS = ("< 3 d", "3–7 d", "7–14 d", "14–30 d", "30–60 d", "60+ d", "No sales")
+STOCK_VIEWS = ("Most at risk", "By category", "Days of cover")
+
+
+def _dashboard_data(db, days: int) -> dict:
+    """Fetch and aggregate everything the dashboard draws (runs on the reader thread).
+
+    Every stock view is bounded (top N, one bar per category, fixed histogram
+    buckets), so chart cost doesn't grow with the catalog.
+    """
+    import numpy as np
+
+    at_risk = db.get_stock_at_risk(DASHBOARD_AT_RISK)
+    by_category = db.get_stock_by_category()
+    plan = db.get_reorder_plan()
+    covers = np.array([r["days_of_cover"] for r in plan if r["days_of_cover"] is not None], dtype=float)
+    buckets = np.bincount(
+        np.searchsorted(COVERAGE_EDGES, covers, side="right"), minlength=len(COVERAGE_EDGES) + 1
+    )
+    sales = db.get_sales_trend(days)
+    stock = db.get_stock_trend(days)
+    return {
+        "product_count": sum(r["products"] for r in by_category),
+        "stock_views": {
+            "Most at risk": {
+                "title": f"Most At-Risk Products (Top {DASHBOARD_AT_RISK} by Stock / Restock Level)",
+                "ylabel": "Quantity",
+                "labels": [r["name"] for r in at_risk],
+                "series": [
+                    ("Current Stock", [r["stock"] for r in at_risk]),
+                    ("Restock Level", [r["restock_level"] for r in at_risk]),
+                ],
+            },
+            "By category": {
+                "title": "Stock vs Restock Thresholds by Category",
+                "ylabel": "Quantity",
+                "labels": [r["category"] for r in by_category],
+                "series": [
+                    ("Current Stock", [r["stock"] for r in by_category]),
+                    ("Restock Level", [r["restock_level"] for r in by_category]),
+                ],
+            },
+            "Days of cover": {
+                "title": "Products by Days of Stock Cover",
+                "ylabel": "Products",
+                "labels": list(COVERAGE_LABELS),
+                "series": [("Products", buckets.tolist() + [len(plan) - len(covers)])],
+            },
+        },
+        "categories": {r["category"]: r["stock"] for r in by_category},
+        "dates": [datetime.strptime(r["day"], "%Y-%m-%d") for r in sales],
+        "sales": [r["total"] for r in sales],
+        "stock_dates": [datetime.strptime(day, "%Y-%m-%d") for day, _total in stock],
+        "stock": [total for _day, total in stock],
+    }
 
 
 class DashboardTab(QWidget):
-    """Visual stock and sales analytics dashboard."""
+    """Visual stock and sales analytics dashboard.
+
+    Data is fetched and aggregated on a BackgroundReader. Charts are built
+    once and refreshed by updating their artists. Results are cached per
+    (data version, range) and the rendered trend chart per range, so
+    switching ranges with no new sales just blits stored pixels. The stock
+    chart shows one of the bounded STOCK_VIEWS, all fetched together, so
+    switching views needs no query either.
+    """
     def __init__(self, db: Database, parent=None):
         super().__init__(parent)
         self.db = db
+        self.reader = BackgroundReader(db, self)
+        self._version = None
+        self._data_cache: dict = {}     # days -> _dashboard_data() for self._version
+        self._trend_frames: dict = {}   # (days, canvas size) -> trend_canvas.snapshot()
+        self._stock_data = None         # latest _dashboard_data(), for stock view switches
+        self._bars = None               # (view, bar count, BarContainers) of the stock chart
         self.init_ui()
+        self._build_charts()
         self.refresh_charts()
 
     def init_ui(self):
@@ -1999,7 +4779,14 @@ class DashboardTab(QWidget):
         filter_layout.addWidget(QLabel("Trend Range:"))
         self.range_combo = QComboBox()
         self.range_combo.addItems(["7 Days", "30 Days", "90 Days"])
+        self.range_combo.currentIndexChanged.connect(self.refresh_charts)
         filter_layout.addWidget(self.range_combo)
+        filter_layout.addSpacing(15)
+        filter_layout.addWidget(QLabel("Stock View:"))
+        self.stock_view_combo = QComboBox()
+        self.stock_view_combo.addItems(STOCK_VIEWS)
+        self.stock_view_combo.currentIndexChanged.connect(self._show_stock_view)
+        filter_layout.addWidget(self.stock_view_combo)
         self.refresh_btn = QPushButton("🔄 Refresh Charts")
         self.refresh_btn.clicked.connect(self.refresh_charts)
         filter_layout.addStretch()
@@ -2014,86 +4801,151 @@ class DashboardTab(QWidget):
         layout.addWidget(self.pie_canvas)
         layout.addWidget(self.trend_canvas)
 
-    def refresh_charts(self):
-        data = self.db.get_stock_levels()
-        if not data:
-            show_info(self, "No active products found.")
-            return
+    def _build_charts(self):
+        """Create the axes and the artists that refreshes update in place."""
+        import matplotlib.dates
 
-        # --- Chart 1: Stock vs Restock ---
-        names = [r["name"] for r in data]
-        stocks = [r["stock"] for r in data]
-        restock_lvls = [r["restock_level"] for r in data]
-        categories = [r["category"] or "Uncategorized" for r in data]
-
-        self.bar_canvas.fig.clear()
-        self.bar_canvas.fig.clear()
-        ax1 = self.bar_canvas.fig.add_subplot(111)
-        x = range(len(names))
-        ax1.bar(x, stocks, label="Current Stock", alpha=0.7)
-        ax1.bar(x, restock_lvls, label="Restock Level", alpha=0.7)
-        ax1.set_xticks(x)
-        ax1.set_xticklabels(names, rotation=45, ha="right", fontsize=8)
-        ax1.set_ylabel("Quantity")
-        ax1.set_title("Stock vs Restock Thresholds")
-        ax1.legend()
-        self.bar_canvas.draw()
+        # --- Chart 1: Stock view (see STOCK_VIEWS) ---
+        self.bar_ax = self.bar_canvas.fig.add_subplot(111)
+        self.bar_canvas.fig.subplots_adjust(bottom=0.3)  # room for rotated labels
 
         # --- Chart 2: Category Pie ---
-        self.pie_canvas.fig.clear()
-        ax2 = self.pie_canvas.fig.add_subplot(111)
-        cat_totals = {}
-        for cat, qty in zip(categories, stocks):
-            cat_totals[cat] = cat_totals.get(cat, 0) + qty
-        ax2.pie(cat_totals.values(), labels=cat_totals.keys(), autopct="%1.1f%%", startangle=90)
-        ax2.set_title("Stock Distribution by Category")
+        self.pie_ax = self.pie_canvas.fig.add_subplot(111)
         self.pie_canvas.fig.subplots_adjust(top=0.85)  # ✅ Gives space for title
-        self.pie_canvas.draw()
 
         # --- Chart 3: Sales vs Stock (Twin-Axis for Supermarkets) ---
-        days = int(self.range_combo.currentText().split()[0])
-        sales = self.db.get_sales_trend(days)
-        stock = self.db.get_stock_trend(days)
-
-        dates = [r["day"] for r in sales]
-        sales_values = [r["total"] for r in sales]
-        avg_stock = stock[0][1] if stock else 0
-
-        self.trend_canvas.fig.clear()
         fig = self.trend_canvas.fig
         ax1 = fig.add_subplot(111)
-
         # Left Y-axis → Sales
-        if sales:
-            ax1.plot(dates, sales_values, "o-", color="royalblue", label="Sales Total (₹)", linewidth=2)
+        (self.sales_line,) = ax1.plot([], [], "o-", color="royalblue", label="Sales Total (₹)", linewidth=2)
         ax1.set_xlabel("Date")
         ax1.set_ylabel("Sales (₹)", color="royalblue")
         ax1.tick_params(axis="y", labelcolor="royalblue")
-        ax1.set_ylim(bottom=0)   # ✅ Prevents squashed chart when sales > 10k
-
+        ax1.xaxis_date()
+        locator = matplotlib.dates.AutoDateLocator(maxticks=8)
+        ax1.xaxis.set_major_locator(locator)
+        ax1.xaxis.set_major_formatter(matplotlib.dates.ConciseDateFormatter(locator))
 
         # Right Y-axis → Stock
         ax2 = ax1.twinx()
-        ax2.plot(dates, [avg_stock]*len(dates), "--", color="seagreen", label=f"Avg Stock ({avg_stock:.1f})", linewidth=1.8)
+        # Closing stock per day from the ledger checkpoints; it changes in steps
+        (self.stock_line,) = ax2.plot(
+            [], [], "--", color="seagreen", linewidth=1.8, drawstyle="steps-post", label="Total Stock (Qty)"
+        )
         ax2.set_ylabel("Stock (Qty)", color="seagreen")
         ax2.tick_params(axis="y", labelcolor="seagreen")
 
-        # Titles and legend
-        fig.suptitle(f"Sales & Stock Trends (Last {days} Days)", fontsize=12, fontweight="bold")
-        lines, labels = ax1.get_legend_handles_labels()
-        lines2, labels2 = ax2.get_legend_handles_labels()
-        ax1.legend(lines + lines2, labels + labels2, loc="upper left")
-
-        fig.autofmt_xdate(rotation=45)
+        self.trend_title = fig.suptitle("", fontsize=12, fontweight="bold")
+        self.trend_ax, self.trend_stock_ax = ax1, ax2
         fig.tight_layout(rect=[0, 0, 1, 0.95])   # ✅ Prevents legend cutoff
-        self.trend_canvas.draw()
 
+    def _days(self) -> int:
+        return int(self.range_combo.currentText().split()[0])
 
+    def refresh_charts(self):
+        days = self._days()
+        cached = self._data_cache.get(days)
+        if cached is not None:
+            self._show_trend(days, cached)  # instant; confirmed (or replaced) below
+
+        known_version = self._version
+
+        def load(ctx):
+            version = ctx.db.get_data_version()
+            if version == known_version and cached is not None:
+                return version, days, None
+            return version, days, _dashboard_data(ctx.db, days)
+
+        self.reader.submit("dashboard", load, self._on_dashboard_data)
+
+    def _on_dashboard_data(self, result) -> None:
+        version, days, data = result
+        if data is None:
+            return  # nothing committed since the cached frame was drawn
+        if version != self._version:
+            self._version = version
+            self._data_cache.clear()
+            self._trend_frames.clear()
+            self._show_stock_charts(data)
+        self._data_cache[days] = data
+        if days == self._days():
+            self._show_trend(days, data)
+
+    def _show_stock_charts(self, data: dict) -> None:
+        self._stock_data = data
+        if not data["product_count"]:
+            show_info(self, "No active products found.")
+        self._show_stock_view()
+
+        # Wedge count follows the categories, so the pie is redrawn
+        ax2 = self.pie_ax
+        ax2.clear()
+        cat_totals = data["categories"]
+        if cat_totals:
+            ax2.pie(cat_totals.values(), labels=cat_totals.keys(), autopct="%1.1f%%", startangle=90)
+        ax2.set_title("Stock Distribution by Category")
+        self.pie_canvas.draw_idle()
 
-        # --- PATCH START: X-axis spacing (fixed) ---
-        import matplotlib.ticker
-        ax1.xaxis.set_major_locator(matplotlib.ticker.MaxNLocator(8))
-        # --- PATCH END ---
+    def _show_stock_view(self) -> None:
+        if self._stock_data is None:
+            return
+        name = self.stock_view_combo.currentText()
+        view = self._stock_data["stock_views"][name]
+        labels, series = view["labels"], view["series"]
+
+        ax1 = self.bar_ax
+        x = list(range(len(labels)))
+        if self._bars is not None and self._bars[:2] == (name, len(labels)):
+            # Same view and bar count: just move the existing rectangles
+            for bars, (_label, values) in zip(self._bars[2], series):
+                for rect, h in zip(bars, values):
+                    rect.set_height(h)
+        else:
+            if self._bars is not None:
+                for bars in self._bars[2]:
+                    bars.remove()
+            containers = [ax1.bar(x, values, label=label, alpha=0.7) for label, values in series]
+            self._bars = (name, len(labels), containers)
+            ax1.legend()
+        step = max(1, -(-len(labels) // DASHBOARD_TICK_LABELS))
+        ax1.set_xticks(x[::step])
+        ax1.set_xticklabels(labels[::step], rotation=45, ha="right", fontsize=8)
+        ax1.set_ylabel(view["ylabel"])
+        ax1.set_title(view["title"])
+        ax1.relim()
+        ax1.autoscale_view()
+        self.bar_canvas.draw_idle()
+
+    def _show_trend(self, days: int, data: dict) -> None:
+        import matplotlib.dates
+
+        dates = matplotlib.dates.date2num(data["dates"]) if data["dates"] else []
+        stock_dates = matplotlib.dates.date2num(data["stock_dates"]) if data["stock_dates"] else []
+        self.sales_line.set_data(dates, data["sales"])
+        self.stock_line.set_data(stock_dates, data["stock"])
+        self.trend_title.set_text(f"Sales & Stock Trends (Last {days} Days)")
+
+        ax1, ax2 = self.trend_ax, self.trend_stock_ax
+        for ax in (ax1, ax2):
+            ax.relim()
+            ax.autoscale_view()
+        # Always show the whole selected window, even with gaps or one sale day
+        today = datetime.combine(date.today(), datetime.min.time())
+        ax1.set_xlim(matplotlib.dates.date2num([today - timedelta(days=days), today + timedelta(days=1)]))
+        ax1.set_ylim(bottom=0)   # ✅ Prevents squashed chart when sales > 10k
+        ax1.legend(
+            [self.sales_line, self.stock_line],
+            [self.sales_line.get_label(), self.stock_line.get_label()],
+            loc="upper left",
+        )
+
+        key = (days, self.trend_canvas.size_key())
+        frame = self._trend_frames.get(key)
+        if frame is not None:
+            self.trend_canvas.restore(frame)
+        else:
+            self.trend_canvas.draw()
+            self._trend_frames[key] = self.trend_canvas.snapshot()
 
 
 
@@ -2104,47 +4956,90 @@ class AIInsightsEngine:
     def __init__(self, db: Database):
         self.db = db
 
-    def get_sales_dataframe(self, days: int = 30) -> pd.DataFrame:
-        rows = self.db.get_sales_details(days)
-        if not rows:
-            return pd.DataFrame(columns=["Product", "Qty", "Day"])
-        df = pd.DataFrame(rows, columns=["Product", "Qty", "Day"])
-        df["Day"] = pd.to_datetime(df["Day"])
-        return df
-
-    def top_products(self, df: pd.DataFrame, n: int = 5) -> pd.Series:
-        return df.groupby("Product")["Qty"].sum().sort_values(ascending=False).head(n)
-
-    def slow_products(self, df: pd.DataFrame, n: int = 5) -> pd.Series:
-        return df.groupby("Product")["Qty"].sum().sort_values(ascending=True).head(n)
-
-    def forecast_sales(self, df: pd.DataFrame, days_forward: int = 7) -> pd.DataFrame:
-        """Forecast total daily sales using Linear Regression."""
-        daily = df.groupby("Day")["Qty"].sum().reset_index()
-        daily["t"] = np.arange(len(daily))
-        if len(daily) < 3:
+    @staticmethod
+    def _series(rows, name: str) -> "pd.Series":
+        import pandas as pd
+
+        return pd.Series({r[0]: r[1] for r in rows}, name=name, dtype=float)
+
+    def top_products(self, days: int = 30, n: int = 5) -> "pd.Series":
+        return self._series(self.db.get_product_sales_ranking(days, n), "Qty")
+
+    def slow_products(self, days: int = 30, n: int = 5) -> "pd.Series":
+        return self._series(self.db.get_product_sales_ranking(days, n, ascending=True), "Qty")
+
+    def forecast_demand(self, days: int = 90, horizon: int = 7):
+        """Per-product daily demand forecast for the next ``horizon`` days.
+
+        Builds a dense day x product matrix of the last ``days`` complete days
+        (days without sales count as zero) and fits every product at once with
+        one least-squares solve: intercept, linear trend and, given two weeks
+        of history, day-of-week offsets. Returns (product_ids, first_day,
+        forecast) where forecast has shape (horizon, len(product_ids)).
+        """
+        import numpy as np
+
+        today = date.today()
+        start = today - timedelta(days=days)
+        rows = self.db.get_product_daily_quantities(start, today)
+        if len(rows) < 3:  # rows are days with sales
+            return np.empty(0, dtype=np.int64), today, np.empty((horizon, 0))
+        ids = [np.fromstring(pids, dtype=np.int64, sep=",") for _, pids, _ in rows]
+        day_idx = np.repeat([offset for offset, _, _ in rows], [len(i) for i in ids])
+        qty = np.concatenate([np.fromstring(q, dtype=np.int64, sep=",") for _, _, q in rows]) / 1000.0
+        product_ids, col_idx = np.unique(np.concatenate(ids), return_inverse=True)
+        demand = np.zeros((days, len(product_ids)))
+        demand[day_idx, col_idx] = qty  # (day, product) is unique in the rollup
+
+        seasonal = days >= 14
+
+        def design(t):
+            cols = [np.ones(len(t)), t / days]
+            if seasonal:
+                dow = (start.weekday() + t) % 7
+                cols.extend(dow == k for k in range(1, 7))
+            return np.column_stack(cols).astype(float)
+
+        # Same design matrix for every product, so all SKUs solve in one call
+        coef, *_ = np.linalg.lstsq(design(np.arange(days)), demand, rcond=None)
+        forecast = design(np.arange(days, days + horizon)) @ coef
+        return product_ids, today, np.clip(forecast, 0.0, None)
+
+    def forecast_sales(self, days: int = 30, days_forward: int = 7) -> "pd.DataFrame":
+        """Forecast total daily units sold as the sum of the per-product forecasts."""
+        import pandas as pd
+
+        product_ids, first_day, forecast = self.forecast_demand(days, days_forward)
+        if not len(product_ids):
             return pd.DataFrame(columns=["Day", "Forecast"])
-        model = LinearRegression()
-        model.fit(daily[["t"]], daily["Qty"])
-        future_t = np.arange(len(daily), len(daily) + days_forward).reshape(-1, 1)
-        preds = model.predict(future_t)
-        future_dates = pd.date_range(daily["Day"].max() + pd.Timedelta(days=1), periods=days_forward)
-        return pd.DataFrame({"Day": future_dates, "Forecast": preds})
-
-    def restock_suggestions(self) -> pd.DataFrame:
-        rows = self.db.get_stock_levels()
-        df = pd.DataFrame(rows, columns=["name", "category", "stock", "restock_level"])
-        return df[df["stock"] <= df["restock_level"]]
-
-    def top_customers(self, days: int = 30) -> pd.Series:
-        rows = self.db.get_all_invoices_data()
-        if not rows:
-            return pd.Series(dtype=float)
-        df = pd.DataFrame(rows, columns=["ID", "DateTime", "Customer", "Subtotal", "Discount", "Tax", "Total", "Payment"])
-        df["DateTime"] = pd.to_datetime(df["DateTime"])
-        cutoff = pd.Timestamp.now() - pd.Timedelta(days=days)
-        df = df[df["DateTime"] >= cutoff]
-        return df.groupby("Customer")["Total"].sum().sort_values(ascending=False).head(5)
+        future_dates = pd.date_range(first_day, periods=days_forward)
+        return pd.DataFrame({"Day": future_dates, "Forecast": forecast.sum(axis=1)})
+
+    def restock_suggestions(self, days: int = 30, horizon: int = 7) -> "pd.DataFrame":
+        """Reorder plan rows that need ordering, plus products the forecast expects to sell out.
+
+        The order quantity is the larger of the reorder plan's and the
+        forecast ``horizon``-day demand topped up to the restock level.
+        """
+        import numpy as np
+        import pandas as pd
+
+        rows = self.db.get_reorder_plan()
+        df = pd.DataFrame(
+            [dict(r) for r in rows],
+            columns=["id", "name", "category", "stock", "restock_level", "velocity",
+                     "days_of_cover", "needs_reorder", "suggested_qty"],
+        )
+        product_ids, _first_day, forecast = self.forecast_demand(days, horizon)
+        demand = pd.Series(forecast.sum(axis=0), index=product_ids, dtype=float)
+        df["forecast"] = df["id"].map(demand).fillna(0.0)
+        forecast_qty = np.ceil((df["forecast"] + df["restock_level"] - df["stock"]).clip(lower=0.0))
+        df["suggested_qty"] = np.maximum(df["suggested_qty"].astype(float), forecast_qty)
+        low = df[(df["needs_reorder"] == 1) | (df["forecast"] > df["stock"])]
+        return low.sort_values("days_of_cover", na_position="last")
+
+    def top_customers(self, days: int = 30, n: int = 5) -> "pd.Series":
+        return self._series(self.db.get_top_customers(days, n), "Total")
 
 
 class AIInsightsTab(QWidget):
@@ -2190,10 +5085,11 @@ class AIInsightsTab(QWidget):
         layout.addWidget(self.chart_canvas, 3)
 
     def generate_insights(self):
+        import pandas as pd
+
         try:
             days = int(self.range_combo.currentText().split()[0])
-            df = self.engine.get_sales_dataframe(days)
-            if df.empty:
+            if not self.db.get_sales_trend(days):
                 self.result_text.setPlainText("No sales data available for this period.")
                 self.chart_canvas.fig.clear()
                 self.chart_canvas.draw()
@@ -2202,8 +5098,8 @@ class AIInsightsTab(QWidget):
             summary = []
 
             # Top / slow products
-            top = self.engine.top_products(df)
-            slow = self.engine.slow_products(df)
+            top = self.engine.top_products(days)
+            slow = self.engine.slow_products(days)
             summary.append(f"🏆 Top {len(top)} Products (Last {days} days):")
             summary.extend([f"  • {p}: {q:.0f} units" for p, q in top.items()])
             summary.append("")
@@ -2212,11 +5108,15 @@ class AIInsightsTab(QWidget):
             summary.append("")
 
             # Restock suggestions
-            low = self.engine.restock_suggestions()
+            low = self.engine.restock_suggestions(days)
             if not low.empty:
                 summary.append("⚠️ Restock Recommendations:")
                 for _, row in low.iterrows():
-                    summary.append(f"  • {row['name']} (Stock: {row['stock']}, Restock @ {row['restock_level']})")
+                    cover = "" if pd.isna(row["days_of_cover"]) else f", {row['days_of_cover']:.1f} days left"
+                    summary.append(
+                        f"  • {row['name']} (Stock: {row['stock']}{cover}, Restock @ {row['restock_level']}, "
+                        f"7-day demand ≈ {row['forecast']:.0f}, order {row['suggested_qty']:.0f})"
+                    )
                 summary.append("")
             else:
                 summary.append("✅ All items are above restock thresholds.\n")
@@ -2230,7 +5130,7 @@ class AIInsightsTab(QWidget):
                 summary.append("")
 
             # Forecast
-            forecast = self.engine.forecast_sales(df)
+            forecast = self.engine.forecast_sales(days)
             if not forecast.empty:
                 summary.append("📈 Next 7-Day Sales Forecast:")
                 for _, row in forecast.iterrows():
@@ -2247,7 +5147,7 @@ class AIInsightsTab(QWidget):
         except Exception as e:
             self.result_text.setPlainText(f"❌ Error generating insights:\n{e}")
 
-    def plot_forecast(self, forecast_df: pd.DataFrame):
+    def plot_forecast(self, forecast_df: "pd.DataFrame"):
         """Draw forecast line chart."""
         self.chart_canvas.fig.clear()
         ax = self.chart_canvas.fig.add_subplot(111)
@@ -2280,22 +5180,77 @@ class AIInsightsTab(QWidget):
 
 # --------- Main Window --------- #
 
+class LazyTab(QWidget):
+    """Tab placeholder that builds (and loads) the real tab on first activation."""
+
+    def __init__(self, factory, parent=None) -> None:
+        super().__init__(parent)
+        self._factory = factory
+        self.widget: Optional[QWidget] = None
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+    def ensure_built(self) -> QWidget:
+        if self.widget is None:
+            self.widget = self._factory(self)
+            self.layout().addWidget(self.widget)
+        return self.widget
+
+
+PREWARM_DELAY_MS = 1500  # let the Billing tab settle before prewarming others
+
+
 class MainWindow(QMainWindow):
-    def __init__(self, db: Database, parent=None) -> None:
+    def __init__(self, db: Database, parent=None, prewarm: bool = True,
+                 write_queue: Optional[InvoiceWriteQueue] = None) -> None:
         super().__init__(parent)
         self.db = db
         self.setWindowTitle("Luxe Supermarket Billing System")
         self.resize(1300, 750)
 
         tabs = QTabWidget()
-        tabs.addTab(BillingTab(db, self), "Billing / POS")
-        tabs.addTab(ProductsTab(db, self), "Products")
-        tabs.addTab(CustomersTab(db, self), "Customers")
-        tabs.addTab(ReportsTab(db, self), "Reports")
-        tabs.addTab(DashboardTab(db, self), "Dashboard")
-        tabs.addTab(AIInsightsTab(db, self), "AI Insights")
+        tabs.addTab(BillingTab(db, self, write_queue), "Billing / POS")
+        if isinstance(db, RemoteDatabase):
+            # Thin-client till: back-office tabs run against the service host
+            self.setWindowTitle(f"Luxe Supermarket Billing System – {db.base_url}")
+            self.setCentralWidget(tabs)
+            return
+
+        # Everything but Billing is built on first activation, so time-to-first-scan
+        # doesn't grow with the catalog or sales history. Light tabs are prewarmed
+        # one per idle tick once the till is up; Dashboard / AI Insights (matplotlib,
+        # pandas) are only ever built when opened.
+        self._prewarm_queue: list[LazyTab] = []
+        for factory, title, warm in (
+            (lambda parent: ProductsTab(db, parent), "Products", True),
+            (lambda parent: CustomersTab(db, parent), "Customers", True),
+            (lambda parent: ReportsTab(db, parent), "Reports", True),
+            (lambda parent: DashboardTab(db, parent), "Dashboard", False),
+            (lambda parent: AIInsightsTab(db, parent), "AI Insights", False),
+        ):
+            lazy = LazyTab(factory)
+            tabs.addTab(lazy, title)
+            if warm:
+                self._prewarm_queue.append(lazy)
+        tabs.currentChanged.connect(self._on_tab_changed)
 
         self.setCentralWidget(tabs)
+        if prewarm:
+            QTimer.singleShot(PREWARM_DELAY_MS, self._prewarm_next)
+
+    def _on_tab_changed(self, index: int) -> None:
+        widget = self.centralWidget().widget(index)
+        if isinstance(widget, LazyTab):
+            widget.ensure_built()
+
+    def _prewarm_next(self) -> None:
+        while self._prewarm_queue:
+            lazy = self._prewarm_queue.pop(0)
+            if lazy.widget is None:
+                lazy.ensure_built()
+                break
+        if self._prewarm_queue:
+            QTimer.singleShot(0, self._prewarm_next)
 
     # --------- UI Helper Functions (GLOBAL) --------- #
 from PySide6.QtWidgets import QApplication, QMessageBox
@@ -2390,7 +5345,7 @@ def apply_premium_style(app: QApplication) -> None:
             font-weight: 600;
         }
 
-        QTableWidget {
+        QTableView {
             gridline-color: #dce0f0;
             selection-background-color: #4a6fff;
             selection-color: white;
@@ -2492,9 +5447,204 @@ class LuxeSplashScreen(QSplashScreen):
         if on_finish:
             on_finish()
 
+# ------------------ MULTI-TILL STRESS CHECK ------------------
+def _stress_till(path: str, till_no: int, checkouts: int, product_ids: list, seed: int):
+    """One simulated till: random carts against the shared DB, returns (sold, rejected)."""
+    import random
+
+    rng = random.Random(seed)
+    db = Database(path)
+    sold = rejected = 0
+    for _ in range(checkouts):
+        cart = []
+        for pid in rng.sample(product_ids, k=rng.randint(1, min(4, len(product_ids)))):
+            product = db.get_product_by_id(pid)
+            cart.append(
+                {
+                    "product_id": pid,
+                    "code": product["code"],
+                    "name": product["name"],
+                    "price": float(product["price"]),
+                    "tax_rate": float(product["tax_rate"]),
+                    "quantity": float(rng.randint(1, 3)),
+                }
+            )
+        try:
+            db.create_invoice(None, cart, 0.0, "Cash", 1e9, f"stress till {till_no}")
+            sold += 1
+        except ValueError:
+            rejected += 1
+    return sold, rejected
+
+
+def run_checkout_stress(tills: int = 4, checkouts: int = 200, products: int = 8, stock: float = 250.0) -> bool:
+    """Run `tills` processes checking out concurrently against one scratch DB.
+
+    Stock is deliberately scarce so tills race for the last units. Passes if no
+    product went negative and stock + units sold equals the starting stock.
+    """
+    import multiprocessing
+    import tempfile
+    import time
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "stress.db")
+        db = Database(path)
+        for i in range(products):
+            db.add_product(f"S{i:03d}", f"Stress Item {i}", "Stress", 10.0, 5.0, stock, True)
+        product_ids = [row["id"] for row in db.get_products(active_only=True)]
+
+        started = time.perf_counter()
+        with multiprocessing.Pool(tills) as pool:
+            results = pool.starmap(
+                _stress_till,
+                [(path, n, checkouts, product_ids, 1000 + n) for n in range(tills)],
+            )
+        elapsed = time.perf_counter() - started
+
+        cur = db.conn.cursor()
+        cur.execute("""
+            SELECT products.id, products.stock, IFNULL(SUM(invoice_items.quantity), 0) AS sold
+              FROM products
+         LEFT JOIN invoice_items ON invoice_items.product_id = products.id
+          GROUP BY products.id;
+        """)
+        rows = cur.fetchall()
+        cur.execute("SELECT COUNT(*) FROM invoices;")
+        invoice_count = cur.fetchone()[0]
+        db.conn.close()
+
+    sold = sum(r[0] for r in results)
+    rejected = sum(r[1] for r in results)
+    negative = [r["id"] for r in rows if r["stock"] < 0]
+    mismatched = [r["id"] for r in rows if abs(r["stock"] + r["sold"] - stock) > 1e-9]
+    ok = not negative and not mismatched and invoice_count == sold
+
+    print(f"{tills} tills x {checkouts} checkouts in {elapsed:.2f}s: "
+          f"{sold} invoices, {rejected} rejected for stock")
+    print(f"negative stock: {negative or 'none'}; ledger mismatches: {mismatched or 'none'}")
+    print("PASS" if ok else "FAIL")
+    return ok
+
+
+# ------------------ STARTUP BENCHMARK ------------------
+def benchmark_startup(runs: int = 5) -> None:
+    """Time a cold import of this module in fresh interpreters.
+
+    Compares the billing path (what a till loads before the splash screen)
+    against also importing the analytics/export/cloud stack, i.e. what
+    every start used to pay.
+    """
+    import statistics
+    import subprocess
+    import time
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    module = os.path.splitext(os.path.basename(__file__))[0]
+    cases = [
+        ("billing path (lazy imports)", f"import {module}"),
+        ("+ analytics/export/cloud stack", f"import {module}; {module}.preload_optional_dependencies()"),
+    ]
+    medians = []
+    for label, code in cases:
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], cwd=here, check=True)
+            timings.append(time.perf_counter() - started)
+        medians.append(statistics.median(timings))
+        print(f"{label:<34} median {medians[-1] * 1000:7.0f} ms  (min {min(timings) * 1000:.0f} ms, {runs} runs)")
+    print(f"{'saved at startup':<34}        {(medians[1] - medians[0]) * 1000:7.0f} ms")
+
+
 # ------------------ MAIN FUNCTION ------------------
 def main() -> None:
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="Luxe Supermarket POS")
+    parser.add_argument("--db", default="supermarket.db", help="SQLite database file")
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="run the headless checkout service for multiple tills (no GUI)",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="--serve: address to bind (0.0.0.0 for LAN tills)")
+    parser.add_argument("--port", type=int, default=SERVICE_DEFAULT_PORT, help="--serve: TCP port")
+    parser.add_argument("--pool-size", type=int, default=4, help="--serve: reader connections")
+    parser.add_argument(
+        "--server",
+        metavar="URL",
+        help="run this till as a thin client of a checkout service, e.g. http://host:8765",
+    )
+    parser.add_argument(
+        "--bench-startup",
+        action="store_true",
+        help="measure cold-start import time with and without the analytics stack, then exit",
+    )
+    parser.add_argument(
+        "--stress-checkout",
+        type=int,
+        metavar="TILLS",
+        help="run a concurrent multi-till checkout check on a scratch DB and exit",
+    )
+    parser.add_argument(
+        "--export-history",
+        metavar="DIR",
+        help="append new invoices to a month-partitioned columnar archive in DIR and exit",
+    )
+    parser.add_argument(
+        "--history-format",
+        choices=sorted(HISTORY_FORMATS),
+        default="parquet",
+        help="--export-history: Parquet files or memory-mappable Arrow IPC files",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="--export-history: ignore the archive watermark and export everything",
+    )
+    parser.add_argument(
+        "--archive-before",
+        metavar="YYYY-MM-DD",
+        type=date.fromisoformat,
+        help="move invoices dated before this day into per-year archive databases and exit",
+    )
+    parser.add_argument(
+        "--rebuild-rollups",
+        action="store_true",
+        help="recompute the daily sales rollups from the invoice history and exit",
+    )
+    parser.add_argument(
+        "--journal",
+        metavar="FILE",
+        help="write-behind checkouts: journal invoices to FILE and commit them in batches "
+             "(replayed on the next start after a crash)",
+    )
+    # Unknown arguments are left for Qt (e.g. -style)
+    args, qt_args = parser.parse_known_args()
+    if args.journal and args.server:
+        parser.error("--journal applies to the process that owns the database, not a --server till")
+
+    if args.bench_startup:
+        benchmark_startup()
+        return
+    if args.stress_checkout:
+        sys.exit(0 if run_checkout_stress(tills=args.stress_checkout) else 1)
+    if args.export_history:
+        written = export_sales_history(Database(args.db), args.export_history, args.history_format, args.full)
+        print(f"Exported {written['invoices']} invoices, {written['invoice_items']} invoice lines")
+        return
+    if args.archive_before:
+        moved = Database(args.db).archive_invoices(args.archive_before)
+        for year, count in moved.items():
+            print(f"{year}: archived {count} invoices")
+        return
+    if args.rebuild_rollups:
+        Database(args.db).rebuild_rollups()
+        return
+    if args.serve:
+        serve(args.db, host=args.host, port=args.port, pool_size=args.pool_size, journal=args.journal)
+        return
+
+    app = QApplication(sys.argv[:1] + qt_args)
 
     # 🌈 Apply Fusion base + luxury palette with proper text contrast
     app.setStyle("Fusion")
@@ -2516,13 +5666,16 @@ def main() -> None:
     apply_premium_style(app)
 
     # 🗄️ Initialize the database
-    db = Database()
+    db = RemoteDatabase(args.server) if args.server else Database(args.db)
+    write_queue = InvoiceWriteQueue(db, args.journal) if args.journal else None
+    if write_queue is not None:
+        app.aboutToQuit.connect(lambda: write_queue.close(db))
 
     # ✅ Keep MainWindow alive after showing
     window_holder = {}
 
     def show_main_window():
-        window_holder["window"] = MainWindow(db)
+        window_holder["window"] = MainWindow(db, write_queue=write_queue)
         window_holder["window"].showMaximized()
 
     # 🚀 Show splash screen, then show main window